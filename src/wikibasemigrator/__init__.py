@@ -1,8 +1,12 @@
-import importlib.metadata
-
 from wikibaseintegrator.entities import ItemEntity, LexemeEntity, MediaInfoEntity, PropertyEntity
 
-__version__ = importlib.metadata.version("wikibasemigrator")
+try:
+    # generated by the hatch version build hook
+    from wikibasemigrator._version import __version__
+except ImportError:
+    import importlib.metadata
+
+    __version__ = importlib.metadata.version("wikibasemigrator")
 
 # Wikibaseintegrator BaseEntity does not support all the methods that the subclasses all have
 WbEntity = ItemEntity | PropertyEntity | LexemeEntity | MediaInfoEntity
@@ -1,21 +1,18 @@
-from concurrent.futures import Future
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Annotated
 
 import typer
-from nicegui import native
 from rich import get_console
-from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
-from rich.progress import open as rich_open
+from rich.progress import BarColumn, Progress, SpinnerColumn, TaskProgressColumn, TextColumn, TimeElapsedColumn
 from rich.table import Table
 
 from wikibasemigrator import config
-from wikibasemigrator.migrator import WikibaseMigrator
 from wikibasemigrator.model.migration_mark import MigrationMark
 from wikibasemigrator.model.profile import WikibaseMigrationProfile, load_profile
 from wikibasemigrator.model.translations import EntitySetTranslationResult
-from wikibasemigrator.web.webserver import DEFAULT_ICON_PATH, Webserver
-from wikibasemigrator.wikibase import Query
+from wikibasemigrator.wikibase import MediaWikiEndpoint, Query
 
 app = typer.Typer()
 console = get_console()
@@ -28,11 +25,13 @@ def complete_profile_paths(incomplete: str):
     """
     List of wikibase migration profiles in the default location
     """
-    profiles = DEFAULT_PROFILE_PATH.iterdir()
-    valid_completion_items = [profile.name for profile in profiles]
-    for name in valid_completion_items:
-        if name.startswith(incomplete):
-            yield name
+    try:
+        with os.scandir(DEFAULT_PROFILE_PATH) as profiles:
+            for profile in profiles:
+                if profile.name.startswith(incomplete):
+                    yield profile.name
+    except FileNotFoundError:
+        return
 
 
 def get_profile_path(name: str) -> Path:
@@ -57,6 +56,11 @@ def native_app(
     Run the WikibaseMigrator web server as local app
     Note: Experimental feature as some of the imported resources are not localized yet
     """
+    # nicegui is imported lazily as it slows down the startup of all other commands
+    from nicegui import native
+
+    from wikibasemigrator.web.webserver import DEFAULT_ICON_PATH, Webserver
+
     profile_path = get_profile_path(config)
     webserver = Webserver(profile_path, icon_path=DEFAULT_ICON_PATH)
     webserver.run(
@@ -78,6 +82,8 @@ def webserver_app(
     """
     Start the WikibaseMigrator web server
     """
+    from wikibasemigrator.web.webserver import DEFAULT_ICON_PATH, Webserver
+
     profile_path = get_profile_path(config)
     Webserver(profile_path, DEFAULT_ICON_PATH).run(host=host, port=port, reload=False)
 
@@ -112,9 +118,13 @@ def migrate(
     """
     Migrate the provided entities
     """
+    from wikibasemigrator.migrator import WikibaseMigrator
+
     progress = Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(),
         TimeElapsedColumn(),
     )
     profile_path = get_profile_path(config)
@@ -124,6 +134,7 @@ def migrate(
     profile: WikibaseMigrationProfile = load_profile(profile_path)
     console.print(f"Loaded profile: {profile.name}")
 
+    query_str = None
     if entity is None:
         query_path: Path | None
         if isinstance(query_file, str):
@@ -131,13 +142,27 @@ def migrate(
         else:
             query_path = query_file
         query_str = resolve_query_params(query=query, query_file=query_path)
-        entities = select_entities_from_query(query_str, profile=profile, progress=progress)
-    else:
-        entities = entity
     migrator = WikibaseMigrator(profile)
-    translations = translate_entities(entities, migrator, progress)
-    source_labels = _query_source_labels(translations=translations, profile=profile, progress=progress)
-    target_labels = _query_target_labels(translations=translations, profile=profile, progress=progress)
+    # the progress display is started once for all phases → the helpers expect an already started display
+    with progress:
+        if query_str is not None:
+            entities = select_entities_from_query(query_str, profile=profile, progress=progress)
+        else:
+            entities = entity
+        translations = translate_entities(entities, migrator, progress)
+        mapping = translations.get_mapping()
+        source_ids = list(mapping.keys())
+        target_ids = list({target_id for target_id in mapping.values() if target_id is not None})
+        # source and target are independent endpoints → query both concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source_future = executor.submit(
+                _query_source_labels, entity_ids=source_ids, profile=profile, progress=progress
+            )
+            target_future = executor.submit(
+                _query_target_labels, entity_ids=target_ids, profile=profile, progress=progress
+            )
+            source_labels = source_future.result()
+            target_labels = target_future.result()
     show_translation_result(translations)
     if show_details or not force:
         show_translation_details(
@@ -151,7 +176,10 @@ def migrate(
         print("Not migrating entities")
         raise typer.Abort()
     else:
-        with Progress(*Progress.get_default_columns()) as progress:
+        # only show the migration progress when the display is restarted after the confirmation
+        for task_id in progress.task_ids:
+            progress.update(task_id, visible=False)
+        with progress:
             migration_task = progress.add_task("[green]Migrating entities...", total=len(translations.entities))
 
             def update_progress(future: Future):
@@ -181,8 +209,8 @@ def migrate(
 
 def show_translation_details(
     translations: EntitySetTranslationResult,
-    source_labels: dict[str, str | None],
-    target_labels: dict[str, str | None],
+    source_labels: dict[str, str],
+    target_labels: dict[str, str],
     profile: WikibaseMigrationProfile,
 ):
     """
@@ -203,53 +231,59 @@ def show_translation_details(
 def translate_entities(entities: list[str], migrator, progress: Progress) -> EntitySetTranslationResult:
     """
     Translate the entities
+    Expects the progress display to be already started by the caller
     :return:
     """
     console.log(f"Start translation of {len(entities)} items")
-    with progress:
-        translation_task = progress.add_task("[green]Translating entities...", total=1, completed=1)
-        translations = migrator.translate_entities_by_id(entities)
-        progress.update(translation_task, completed=1)
+    translation_task = progress.add_task("[green]Translating entities...", total=len(entities))
+
+    def update_progress(future: Future):
+        """
+        Update the progress bar
+        :param future:
+        :return:
+        """
+        progress.advance(translation_task)
+
+    translations = migrator.translate_entities_by_id(entities, entity_done_callback=update_progress)
+    progress.update(translation_task, completed=len(entities))
     return translations
 
 
 def _query_source_labels(
-    translations: EntitySetTranslationResult, profile: WikibaseMigrationProfile, progress: Progress
-) -> dict[str, str | None]:
+    entity_ids: list[str], profile: WikibaseMigrationProfile, progress: Progress
+) -> dict[str, str]:
     """
     Query source labels
+    Expects the progress display to be already started by the caller
+    :param entity_ids: ids of the source entities
     :return:
     """
-    with progress:
-        target_label_task = progress.add_task("[green]Querying target labels...", total=1, completed=1)
-        lod = Query.get_entity_label(
-            endpoint_url=profile.target.sparql_url,
-            entity_ids=translations.get_target_entity_ids(),
-            item_prefix=profile.target.item_prefix,
-        )
-        target_labels = {label["qid"]: label.get("label") for label in lod if isinstance(label.get("label"), str)}
-        progress.update(target_label_task, completed=1)
-    return target_labels
+    source_label_task = progress.add_task("[green]Querying source labels...", total=1, completed=1)
+    source_labels = MediaWikiEndpoint.batch_get_labels(
+        mediawiki_api_url=profile.source.mediawiki_api_url,
+        entity_ids=entity_ids,
+    )
+    progress.update(source_label_task, completed=1)
+    return source_labels
 
 
 def _query_target_labels(
-    translations: EntitySetTranslationResult, profile: WikibaseMigrationProfile, progress: Progress
-) -> dict[str, str | None]:
+    entity_ids: list[str], profile: WikibaseMigrationProfile, progress: Progress
+) -> dict[str, str]:
     """
     Query target labels
+    Expects the progress display to be already started by the caller
+    :param entity_ids: ids of the target entities
     :return:
     """
-    source_labels = {}
-    with progress:
-        source_label_task = progress.add_task("[green]Querying source labels...", total=1, completed=1)
-        lod = Query.get_entity_label(
-            endpoint_url=profile.source.sparql_url,
-            entity_ids=translations.get_source_entity_ids(),
-            item_prefix=profile.source.item_prefix,
-        )
-        source_labels = {label["qid"]: label.get("label") for label in lod if isinstance(label.get("label"), str)}
-        progress.update(source_label_task, completed=1)
-    return source_labels
+    target_label_task = progress.add_task("[green]Querying target labels...", total=1, completed=1)
+    target_labels = MediaWikiEndpoint.batch_get_labels(
+        mediawiki_api_url=profile.target.mediawiki_api_url,
+        entity_ids=entity_ids,
+    )
+    progress.update(target_label_task, completed=1)
+    return target_labels
 
 
 def resolve_query_params(query_file: Path | None, query: str | None):
@@ -264,8 +298,7 @@ def resolve_query_params(query_file: Path | None, query: str | None):
             console.print(f"Provided query file {query_file} does not exist", style=STYLE_ERROR_MSG)
             console.log("Aborting migration")
             raise typer.Abort()
-        with rich_open(query_file, "rb") as file:
-            query_str = file.read()
+        query_str = query_file.read_text()
     elif query:
         query_str = query
     else:
@@ -276,23 +309,43 @@ def resolve_query_params(query_file: Path | None, query: str | None):
 def select_entities_from_query(query: str, profile: WikibaseMigrationProfile, progress: Progress):
     """
     Select the entities by executing the query
+    Expects the progress display to be already started by the caller
     :return:
     """
-    with progress:
-        query_task = progress.add_task("[green]Querying entities...", total=1, completed=1)
-        lod = Query.execute_query(query=query, endpoint_url=profile.source.sparql_url)
-        entities_with_prefix = [
-            d.get(config.ITEM_QUERY_VARIABLE) for d in lod if d.get(config.ITEM_QUERY_VARIABLE, None)
-        ]
-        entities = [
-            entity_id.replace(profile.source.item_prefix.unicode_string(), "")
-            for entity_id in entities_with_prefix
-            if entity_id is not None
-        ]
-        progress.update(query_task, completed=1)
+    query_task = progress.add_task("[green]Querying entities...", total=1, completed=1)
+    lod = Query.execute_query(query=query, endpoint_url=profile.source.sparql_url)
+    item_prefix = profile.source.item_prefix.unicode_string()
+    item_variable = config.ITEM_QUERY_VARIABLE
+    entities = [entity_id.removeprefix(item_prefix) for d in lod if (entity_id := d.get(item_variable))]
+    progress.update(query_task, completed=1)
     return entities
 
 
+def entity_id_sort_key(entity_id: str) -> tuple[str, int, str]:
+    """
+    Sort key that orders entity ids by type and numerically by their number e.g. Q2 before Q10
+    :param entity_id: entity id
+    :return: sort key
+    """
+    entity_type, number = entity_id[:1], entity_id[1:]
+    if number.isdecimal():
+        return entity_type, int(number), ""
+    return entity_type, -1, number
+
+
+def print_table(table: Table):
+    """
+    print the given table. Tables exceeding the terminal height are shown in a pager
+    :param table: table to print
+    :return:
+    """
+    if console.is_terminal and table.row_count > console.height:
+        with console.pager(styles=True):
+            console.print(table)
+    else:
+        console.print(table)
+
+
 def show_translation_result(translations: EntitySetTranslationResult):
     """
     show short overview table of the translation result
@@ -313,58 +366,75 @@ def show_translation_result(translations: EntitySetTranslationResult):
 
 def show_applied_mappings(
     translations: EntitySetTranslationResult,
-    source_labels: dict[str, str | None],
-    target_labels: dict[str, str | None],
+    source_labels: dict[str, str],
+    target_labels: dict[str, str],
     profile: WikibaseMigrationProfile,
 ):
     """
     show table of applied mappings
     """
+    mappings = [(source_id, target_id) for source_id, target_id in translations.get_mapping().items() if target_id]
+    if not mappings:
+        return
     mapping_table = Table(title="Applied Mapping")
     mapping_table.add_column("Source", style="blue")
     mapping_table.add_column("Target", style="green")
     mapping_table.add_column("Source URL", justify="left")
     mapping_table.add_column("Target URL", justify="left")
-    for source_id, target_id in sorted(translations.get_mapping().items()):
-        if target_id is None:
-            continue
-        mapping_table.add_row(
-            f"{source_id} ({source_labels.get(source_id)})",
-            f"{target_id} ({target_labels.get(target_id)})",
-            f"{profile.source.item_prefix}{source_id}",
-            f"{profile.target.item_prefix}{target_id}",
+    mappings.sort(key=lambda mapping: entity_id_sort_key(mapping[0]))
+    add_row = mapping_table.add_row
+    source_label = source_labels.get
+    target_label = target_labels.get
+    source_prefix = str(profile.source.item_prefix)
+    target_prefix = str(profile.target.item_prefix)
+    for source_id, target_id in mappings:
+        add_row(
+            f"{source_id} ({source_label(source_id, '')})",
+            f"{target_id} ({target_label(target_id, '')})",
+            f"{source_prefix}{source_id}",
+            f"{target_prefix}{target_id}",
         )
-    console.print(mapping_table)
+    print_table(mapping_table)
 
 
 def show_missing_items(
-    translations: EntitySetTranslationResult, source_labels: dict[str, str | None], profile: WikibaseMigrationProfile
+    translations: EntitySetTranslationResult, source_labels: dict[str, str], profile: WikibaseMigrationProfile
 ):
     """
     show table of missing items
     """
+    missing_items = translations.get_missing_items()
+    if not missing_items:
+        return
     item_table = Table(title="Missing Items")
     item_table.add_column("Item", style="red")
     item_table.add_column("Source URL", justify="left")
-    for source_id in sorted(translations.get_missing_items()):
-        item_table.add_row(f"{source_id} ({source_labels.get(source_id)})", f"{profile.source.item_prefix}{source_id}")
-    console.print(item_table)
+    add_row = item_table.add_row
+    source_label = source_labels.get
+    source_prefix = str(profile.source.item_prefix)
+    for source_id in sorted(missing_items, key=entity_id_sort_key):
+        add_row(f"{source_id} ({source_label(source_id, '')})", f"{source_prefix}{source_id}")
+    print_table(item_table)
 
 
 def show_missing_properties(
-    translations: EntitySetTranslationResult, source_labels: dict[str, str | None], profile: WikibaseMigrationProfile
+    translations: EntitySetTranslationResult, source_labels: dict[str, str], profile: WikibaseMigrationProfile
 ):
     """
     show table of missing properties
     """
+    missing_properties = translations.get_missing_properties()
+    if not missing_properties:
+        return
     property_table = Table(title="Missing Properties")
     property_table.add_column("Property", style="red")
     property_table.add_column("Source URL", justify="left")
-    for source_id in sorted(translations.get_missing_properties()):
-        property_table.add_row(
-            f"{source_id} ({source_labels.get(source_id)})", f"{profile.source.item_prefix}{source_id}"
-        )
-    console.print(property_table)
+    add_row = property_table.add_row
+    source_label = source_labels.get
+    source_prefix = str(profile.source.item_prefix)
+    for source_id in sorted(missing_properties, key=entity_id_sort_key):
+        add_row(f"{source_id} ({source_label(source_id, '')})", f"{source_prefix}{source_id}")
+    print_table(property_table)
 
 
 def show_migration_result(translations: EntitySetTranslationResult, profile: WikibaseMigrationProfile):
@@ -378,26 +448,22 @@ def show_migration_result(translations: EntitySetTranslationResult, profile: Wik
     error_table.add_column("Entity", style="red")
     error_table.add_column("Source URL", justify="left")
     error_table.add_column("Error Message", justify="left")
+    source_prefix = str(profile.source.item_prefix)
+    target_prefix = str(profile.target.item_prefix)
     for translation in translations:
         if translation.created_entity is None:
             console.log(f"Something went wrong migrating entity {translation.original_entity.id} {translation.errors}")
-            if "en" in translation.original_entity.labels.values:
-                label = translation.original_entity.labels.get("en").value
-            else:
-                label = None
+            en_label = translation.original_entity.labels.get("en")
+            label = en_label.value if en_label else None
             target_id = translation.original_entity.id
-            error_table.add_row(
-                f"{target_id} ({label})", f"{profile.source.item_prefix}{target_id}", f"{translation.errors}"
-            )
+            error_table.add_row(f"{target_id} ({label})", f"{source_prefix}{target_id}", f"{translation.errors}")
         else:
-            if "en" in translation.created_entity.labels.values:
-                label = translation.created_entity.labels.get("en").value
-            else:
-                label = None
+            en_label = translation.created_entity.labels.get("en")
+            label = en_label.value if en_label else None
             target_id = translation.created_entity.id
-            result_table.add_row(f"{target_id} ({label})", f"{profile.target.item_prefix}{target_id}")
-    console.print(result_table)
-    console.print(error_table)
+            result_table.add_row(f"{target_id} ({label})", f"{target_prefix}{target_id}")
+    print_table(result_table)
+    print_table(error_table)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""
+Module to persist the entity records of a wikibase between runs
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from wikibasemigrator.model.profile import WikibaseConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENTITY_CACHE_PATH = Path().home().joinpath(".cache/WikibaseMigrator/entities")
+
+
+class EntityCache:
+    """
+    Caches the raw wbgetentities records of a wikibase on disk.
+    Records older than the cache ttl of the wikibase config are not used
+    """
+
+    def __init__(self, wikibase_config: WikibaseConfig, cache_dir: Path | None = None):
+        """
+        constructor
+        :param wikibase_config: wikibase the entity records belong to
+        :param cache_dir: directory to store the cache databases in
+        """
+        if cache_dir is None:
+            cache_dir = DEFAULT_ENTITY_CACHE_PATH
+        self.ttl = wikibase_config.cache_ttl if wikibase_config.cache_ttl is not None else 0
+        mediawiki_api_url = wikibase_config.mediawiki_api_url.unicode_string()
+        self.cache_path = cache_dir.joinpath(f"{hashlib.blake2b(mediawiki_api_url.encode()).hexdigest()[:16]}.db")
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.cache_path, check_same_thread=False)
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS entities "
+                    "(id TEXT PRIMARY KEY, lastrevid INTEGER, record TEXT, inserted_at REAL)"
+                )
+                db.execute("DELETE FROM entities WHERE inserted_at < ?", (time.time() - self.ttl,))
+            self._db = db
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Unable to open the entity cache {self.cache_path}: {e}")
+
+    def get_records(self, entity_ids: list[str]) -> dict[str, dict]:
+        """
+        Get the cached records of the given entities
+        :param entity_ids: ids of the entities
+        :return: records by entity id. Entities without valid cache entry are not included
+        """
+        if self._db is None or not entity_ids:
+            return {}
+        min_inserted_at = time.time() - self.ttl
+        records = {}
+        try:
+            with self._lock:
+                for chunk_start in range(0, len(entity_ids), 500):
+                    chunk = entity_ids[chunk_start : chunk_start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = self._db.execute(
+                        f"SELECT id, record FROM entities WHERE id IN ({placeholders}) AND inserted_at >= ?",
+                        (*chunk, min_inserted_at),
+                    )
+                    records.update({entity_id: json.loads(record) for entity_id, record in cursor})
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Unable to read from the entity cache {self.cache_path}: {e}")
+            return {}
+        logger.debug(f"Loaded {len(records)} of {len(entity_ids)} entity records from the cache")
+        return records
+
+    def store_records(self, records: dict[str, dict]):
+        """
+        Store the given entity records. Existing records of the entities are replaced
+        :param records: records by entity id
+        """
+        if self._db is None:
+            return
+        inserted_at = time.time()
+        rows = [
+            (entity_id, record.get("lastrevid"), json.dumps(record), inserted_at)
+            for entity_id, record in records.items()
+            if "missing" not in record
+        ]
+        try:
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entities (id, lastrevid, record, inserted_at) VALUES (?, ?, ?, ?)", rows
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Unable to store {len(rows)} entity records in the cache {self.cache_path}: {e}")
+
+    def delete_records(self, entity_ids: list[str]):
+        """
+        Delete the cached records of the given entities e.g. after the entities were edited
+        :param entity_ids: ids of the entities
+        """
+        if self._db is None or not entity_ids:
+            return
+        try:
+            with self._lock, self._db:
+                self._db.executemany("DELETE FROM entities WHERE id = ?", [(entity_id,) for entity_id in entity_ids])
+        except sqlite3.Error as e:
+            logger.warning(f"Unable to delete {len(entity_ids)} entity records from the cache {self.cache_path}: {e}")
@@ -1,26 +1,112 @@
+import hashlib
 import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import cache
+from pathlib import Path
 from string import Template
 
+from SPARQLWrapper import CSV
+
 from wikibasemigrator import config, wikibase
 from wikibasemigrator.model.datatypes import WbiDataTypes
 from wikibasemigrator.model.profile import WikibaseConfig, WikibaseMigrationProfile
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAPPING_CACHE_PATH = Path().home().joinpath(".cache/WikibaseMigrator/mappings")
+
+
+@cache
+def get_query_template(query_raw: str) -> Template:
+    """
+    Get the template of the given mapping query. The templates are reused for the same query
+    :param query_raw: mapping query
+    :return: query template
+    """
+    return Template(query_raw)
+
 
 class WikibaseItemMapper:
     """
     Maps items from one wikibase instance to another
     """
 
-    def __init__(self, profile: WikibaseMigrationProfile):
+    def __init__(self, profile: WikibaseMigrationProfile, cache_dir: Path | None = None):
+        """
+        constructor
+        :param profile: migration profile
+        :param cache_dir: directory to persist the mappings in if a cache ttl is configured in the profile
+        """
         self.migration_profile = profile
         self._raw_mappings: set[tuple[str, str]] = set()
+        # index of the raw mappings by source and the sources with new mappings since the last cache update
+        self._targets_by_source: dict[str, list[str]] = dict()
+        self._dirty_sources: set[str] = set()
+        # properties used in the raw mappings for which the property types are needed
+        self._source_props_seen: set[str] = set()
+        self._target_props_seen: set[str] = set()
+        # ids without mapping are cached as None and thus act as negative cache
         self.mappings: dict[str, str | None] = dict()
+        # ordered set of the ids without mapping
+        self._missing: dict[str, None] = dict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # the counters have their own lock so that counting does not wait for running mapping queries
+        self._stats_lock = threading.Lock()
         self.source_property_types: dict[str, WbiDataTypes] = dict()
         self.target_property_types: dict[str, WbiDataTypes] = dict()
+        # guards cache updates as the mapper is shared between translation worker threads
+        self._lock = threading.RLock()
+        self._cache_db: sqlite3.Connection | None = None
+        if profile.mapping.cache_ttl is not None:
+            self._load_persisted_mappings(cache_dir if cache_dir is not None else DEFAULT_MAPPING_CACHE_PATH)
+
+    def _load_persisted_mappings(self, cache_dir: Path):
+        """
+        Open the mapping cache database and load the item mappings that are not older than the configured cache ttl.
+        The database is specific to the mapping location and mapping queries of the profile
+        :param cache_dir: directory of the mapping cache databases
+        """
+        mapping_config = self.migration_profile.mapping.model_dump_json(exclude={"cache_ttl"})
+        cache_key = f"{self.wikibase_config.sparql_url}{mapping_config}"
+        cache_path = cache_dir.joinpath(f"{hashlib.blake2b(cache_key.encode()).hexdigest()[:16]}.db")
+        min_inserted_at = time.time() - self.migration_profile.mapping.cache_ttl
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(cache_path, check_same_thread=False)
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS mappings (source TEXT PRIMARY KEY, target TEXT, inserted_at REAL)"
+                )
+                db.execute("DELETE FROM mappings WHERE inserted_at < ?", (min_inserted_at,))
+            self.mappings.update(db.execute("SELECT source, target FROM mappings"))
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Unable to load the persisted mappings from {cache_path}: {e}")
+            return
+        logger.debug(f"Loaded {len(self.mappings)} persisted mappings from {cache_path}")
+        self._cache_db = db
+
+    def _persist_mappings(self, mappings: dict[str, str]):
+        """
+        Persist the given mappings in the mapping cache database
+        :param mappings: mappings to persist
+        """
+        if self._cache_db is None or not mappings:
+            return
+        inserted_at = time.time()
+        try:
+            with self._cache_db:
+                self._cache_db.executemany(
+                    "INSERT OR REPLACE INTO mappings (source, target, inserted_at) VALUES (?, ?, ?)",
+                    [(source, target, inserted_at) for source, target in mappings.items()],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Unable to persist {len(mappings)} mappings: {e}")
 
     @property
     def wikibase_config(self) -> WikibaseConfig:
@@ -36,70 +122,113 @@ class WikibaseItemMapper:
         :param ids: list of ids
         :return:
         """
-        property_ids = [item for item in ids if item.startswith("P")]
-        item_ids = [item for item in ids if item.startswith("Q")]
-        self._init_cache_for(ids)
-        ids_queries = [
-            ("property", property_ids, self.migration_profile.mapping.property_mapping_query),
-            ("item", item_ids, self.migration_profile.mapping.item_mapping_query),
-        ]
-        for id_type, id_values, query_raw in ids_queries:
-            if id_values:
-                query_template = Template(query_raw)
-                source_items = [f'"{item}"' for item in id_values]
-                logger.debug(f"Querying {id_type} mappings for {len(id_values)} IDs")
-                lod = wikibase.Query.execute_values_query_in_chunks(
-                    query_template=query_template,
-                    param_name=config.MAPPING_QUERY_VALUES_INPUT_VARIABLE,
-                    values=source_items,
-                    endpoint_url=self.wikibase_config.sparql_url,
-                )
-                self._update_raw_cache(lod)
-        self.update_property_type_map()
-        self.update_cache()
+        ids_by_type: dict[str, list[str]] = {"P": [], "Q": []}
+        for id_value in ids:
+            ids_of_type = ids_by_type.get(id_value[:1])
+            if ids_of_type is not None:
+                ids_of_type.append(id_value)
+        property_ids = ids_by_type["P"]
+        item_ids = ids_by_type["Q"]
+        mapping_config = self.migration_profile.mapping
+        if mapping_config.combined_mapping_query is not None:
+            ids_queries = [("entity", property_ids + item_ids, mapping_config.combined_mapping_query)]
+        else:
+            ids_queries = [
+                ("property", property_ids, mapping_config.property_mapping_query),
+                ("item", item_ids, mapping_config.item_mapping_query),
+            ]
+        ids_queries = [(id_type, id_values, query_raw) for id_type, id_values, query_raw in ids_queries if id_values]
+        with self._lock:
+            if ids_queries:
+                # the queries per id type are independent → query them concurrently
+                with ThreadPoolExecutor(max_workers=len(ids_queries)) as executor:
+                    futures = [executor.submit(self._query_mappings, *id_query) for id_query in ids_queries]
+                    for future in futures:
+                        self._update_raw_cache(future.result())
+            self.update_property_type_map()
+            self.update_cache()
+            # the ids without mapping are only published once the query finished → unlocked cache checks never
+            # consider ids as cached that are still queried
+            self._init_cache_for(ids)
+
+    def _query_mappings(self, id_type: str, ids: list[str], query_raw: str) -> list[dict]:
+        """
+        query the mappings of the given ids with the given mapping query
+        :param id_type: type of the ids used for logging
+        :param ids: list of ids
+        :param query_raw: mapping query
+        :return: list of mapping records
+        """
+        query_template = get_query_template(query_raw)
+        source_items = [f'"{item}"' for item in ids]
+        logger.debug(f"Querying {id_type} mappings for {len(ids)} IDs")
+        return wikibase.Query.execute_values_query_in_chunks(
+            query_template=query_template,
+            param_name=config.MAPPING_QUERY_VALUES_INPUT_VARIABLE,
+            values=source_items,
+            endpoint_url=self.wikibase_config.sparql_url,
+            result_format=CSV,
+        )
 
     def update_property_type_map(self):
         """
-        update the property type mappings for source and target properties
+        update the property type mappings for source and target properties.
+        Only the properties with unknown type are queried
         """
+        needed_source_props = self._source_props_seen - self.source_property_types.keys()
+        needed_target_props = self._target_props_seen - self.target_property_types.keys()
+        if not needed_source_props and not needed_target_props:
+            return
         logger.debug("Updating property type mappings")
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            executor.submit(self._update_source_property_types)
-            executor.submit(self._update_target_property_types)
+        source = self.migration_profile.source
+        target = self.migration_profile.target
+        if not needed_source_props:
+            self._update_target_property_types(needed_target_props)
+        elif not needed_target_props:
+            self._update_source_property_types(needed_source_props)
+        elif source.sparql_url == target.sparql_url and source.item_prefix == target.item_prefix:
+            # source and target are the same wikibase → query the types of all properties at once
+            prop_types = self._query_property_types(source, needed_source_props | needed_target_props)
+            self.source_property_types.update({pid: prop_types[pid] for pid in needed_source_props & prop_types.keys()})
+            self.target_property_types.update({pid: prop_types[pid] for pid in needed_target_props & prop_types.keys()})
+        else:
+            # query the target types in the calling thread while the source types are queried in a worker thread
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                source_update = executor.submit(self._update_source_property_types, needed_source_props)
+                self._update_target_property_types(needed_target_props)
+                source_update.result()
 
-    def _update_source_property_types(self):
+    def _update_source_property_types(self, needed_props: set[str]):
         """
         update the property type mappings for source properties
+        :param needed_props: source properties to query the types for
         :return:
         """
-        logger.debug("Updating source property type mappings")
-        used_props = {pid for pid, _ in self._raw_mappings if pid.startswith("P")}
-        cached_types = set(self.source_property_types.keys())
-        needed_props = used_props - cached_types
-        prop_type_mappings = wikibase.Query.get_property_datatype(
-            endpoint_url=self.migration_profile.source.sparql_url,
-            property_ids=list(needed_props),
-            item_prefix=self.migration_profile.source.item_prefix,
-        )
-        wbi_prop_type_mappings = {key: value.get_wbi_type() for key, value in prop_type_mappings.items()}
-        self.source_property_types.update(wbi_prop_type_mappings)
+        logger.debug(f"Updating source property type mappings for {len(needed_props)} properties")
+        self.source_property_types.update(self._query_property_types(self.migration_profile.source, needed_props))
 
-    def _update_target_property_types(self):
+    def _update_target_property_types(self, needed_props: set[str]):
         """
         update the property type mappings for target properties
+        :param needed_props: target properties to query the types for
         :return:
         """
-        logger.debug("Updating target property type mappings")
-        used_props = {pid for _, pid in self._raw_mappings if pid is not None and pid.startswith("P")}
-        cached_types = set(self.target_property_types.keys())
-        needed_props = used_props - cached_types
+        logger.debug(f"Updating target property type mappings for {len(needed_props)} properties")
+        self.target_property_types.update(self._query_property_types(self.migration_profile.target, needed_props))
+
+    def _query_property_types(self, wikibase_config: WikibaseConfig, property_ids: set[str]) -> dict[str, WbiDataTypes]:
+        """
+        query the property types of the given properties
+        :param wikibase_config: wikibase the properties belong to
+        :param property_ids: properties to query the types for
+        :return: mapping from property id to the wbi property type
+        """
         prop_type_mappings = wikibase.Query.get_property_datatype(
-            endpoint_url=self.migration_profile.target.sparql_url,
-            property_ids=list(needed_props),
-            item_prefix=self.migration_profile.target.item_prefix,
+            endpoint_url=wikibase_config.sparql_url,
+            property_ids=list(property_ids),
+            item_prefix=wikibase_config.item_prefix,
         )
-        wbi_prop_type_mappings = {key: value.get_wbi_type() for key, value in prop_type_mappings.items()}
-        self.target_property_types.update(wbi_prop_type_mappings)
+        return {key: value.get_wbi_type() for key, value in prop_type_mappings.items()}
 
     def query_mapping_for(self, item: str):
         """
@@ -113,23 +242,34 @@ class WikibaseItemMapper:
         :param lod: list of mappings to cache
         :return:
         """
-        for record in lod:
-            source = record.get(config.MAPPING_QUERY_SOURCE_VARIABLE, None)
-            target = record.get(config.MAPPING_QUERY_TARGET_VARIABLE, None)
-            if isinstance(source, str) and isinstance(target, str):
-                self._raw_mappings.add((source, target))
+        source_variable = config.MAPPING_QUERY_SOURCE_VARIABLE
+        target_variable = config.MAPPING_QUERY_TARGET_VARIABLE
+        records = [
+            (source, target)
+            for record in lod
+            if isinstance(source := record.get(source_variable), str)
+            and isinstance(target := record.get(target_variable), str)
+        ]
+        new_mappings = [mapping for mapping in dict.fromkeys(records) if mapping not in self._raw_mappings]
+        self._raw_mappings.update(new_mappings)
+        for source, target in new_mappings:
+            self._targets_by_source.setdefault(source, []).append(target)
+        self._dirty_sources.update(source for source, _ in new_mappings)
+        self._source_props_seen.update(source for source, _ in new_mappings if source.startswith("P"))
+        self._target_props_seen.update(target for _, target in new_mappings if target.startswith("P"))
 
     def update_cache(self):
         """
         update the mapping cache and ensure that
-        if multiple mappings for the same property exist that the one with the correct type is chosen
+        if multiple mappings for the same property exist that the one with the correct type is chosen.
+        Only sources with new raw mappings since the last update are resolved
         """
-        d = {}
-        for source, target in self._raw_mappings:
-            d.setdefault(source, []).append(target)
-        for source, target_ids in d.items():
+        # the resolved mappings are published at once after the resolution
+        resolved: dict[str, str] = dict()
+        for source in self._dirty_sources:
+            target_ids = self._targets_by_source[source]
             if len(target_ids) == 1:
-                self.mappings[source] = target_ids[0]
+                resolved[source] = target_ids[0]
             elif source.startswith("P"):
                 source_type = self.source_property_types.get(source, None)
                 matching_type = False
@@ -139,19 +279,26 @@ class WikibaseItemMapper:
                         logger.debug(
                             f"Source property {source} has multiple mappings → Choosing {target_id} from target as it has the same property datatype"  # noqa: E501
                         )
-                        self.mappings[source] = target_id
+                        resolved[source] = target_id
                         matching_type = True
                         break
                 if not matching_type:
                     logger.debug(
                         f"Property with multiple mappings for source {source} and targets {target_ids} → To Resolve this the first property of the list is chosen"  # noqa: E501
                     )
-                    self.mappings[source] = target_ids[0]
+                    resolved[source] = target_ids[0]
             else:
                 logger.debug(
                     f"Entity {source} has multiple mappings in target {target_ids} → To Resolve this the first property of the list is chosen"  # noqa: E501
                 )
-                self.mappings[source] = target_ids[0]
+                resolved[source] = target_ids[0]
+        # property mappings are not persisted as they require the property types
+        self.mappings.update(resolved)
+        item_mappings = {source: target for source, target in resolved.items() if source.startswith("Q")}
+        self._persist_mappings(item_mappings)
+        for source in self._dirty_sources:
+            self._missing.pop(source, None)
+        self._dirty_sources.clear()
 
     def _init_cache_for(self, ids: list[str]) -> None:
         """
@@ -159,9 +306,9 @@ class WikibaseItemMapper:
         :param ids:
         :return:
         """
-        for id_value in ids:
-            if id_value not in self.mappings:
-                self.mappings[id_value] = None
+        new_ids = dict.fromkeys(id_value for id_value in ids if id_value not in self.mappings)
+        self.mappings.update(new_ids)
+        self._missing.update(new_ids)
 
     def prepare_cache_for(self, items: list[str]):
         """
@@ -171,12 +318,22 @@ class WikibaseItemMapper:
         """
         items_to_query = [item for item in items if item not in self.mappings]
         if items_to_query:
-            logger.debug(
-                f"Prepare cache for {len(items_to_query)} items. ({len(items) - len(items_to_query)} were already cached)"  # noqa: E501
-            )
-            start_time = datetime.now()
-            self.query_mappings_for(items_to_query)
-            logger.debug(f"Cache preparation took {datetime.now() - start_time}")
+            with self._lock:
+                items_to_query = [item for item in items_to_query if item not in self.mappings]
+                if items_to_query:
+                    logger.debug(
+                        "Prepare cache for %s items. (%s were already cached)",
+                        len(items_to_query),
+                        len(items) - len(items_to_query),
+                    )
+                    start_time = datetime.now()
+                    self.query_mappings_for(items_to_query)
+                    logger.debug("Cache preparation took %s", datetime.now() - start_time)
+        with self._stats_lock:
+            self.cache_hits += len(items) - len(items_to_query)
+            self.cache_misses += len(items_to_query)
+        if items_to_query:
+            logger.debug("Mapping cache hits: %s, misses: %s", self.cache_hits, self.cache_misses)
 
     def get_mapping_for(self, item: str) -> str | None:
         """
@@ -185,9 +342,23 @@ class WikibaseItemMapper:
         :return: id of the corresponding item in the target wikibase instance
         """
         if not self.is_cached(item):
-            self.query_mapping_for(item)
+            with self._lock:
+                if not self.is_cached(item):
+                    self.query_mapping_for(item)
         return self.mappings.get(item, None)
 
+    def get_mappings_for(self, items: Iterable[str]) -> dict[str, str | None]:
+        """
+        Get the mappings for the given items in the target wikibase instance.
+        Items that are not cached yet are queried together
+        :param items: item ids either Qids or Pids
+        :return: ids of the corresponding items in the target wikibase instance by item id
+        """
+        items = list(items)
+        self.prepare_cache_for(items)
+        mappings = self.mappings
+        return {item: mappings.get(item) for item in items}
+
     def is_cached(self, item: str) -> bool:
         """
         Check if the given entity id is cached
@@ -197,13 +368,17 @@ class WikibaseItemMapper:
         return item in self.mappings
 
     def get_existing_mappings(self) -> dict[str, str]:
-        return {key: value for key, value in self.mappings.items() if value is not None}
+        with self._lock:
+            return {key: value for key, value in self.mappings.items() if value is not None}
 
     def get_missing_mappings(self) -> list[str]:
-        return [key for key, value in self.mappings.items() if value is None]
+        with self._lock:
+            return list(self._missing)
 
     def get_missing_item_mapings(self) -> list[str]:
-        return [value for value in self.get_missing_mappings() if value.startswith("Q")]
+        with self._lock:
+            return [key for key in self._missing if key.startswith("Q")]
 
     def get_missing_property_mapings(self) -> list[str]:
-        return [value for value in self.get_missing_mappings() if value.startswith("P")]
+        with self._lock:
+            return [key for key in self._missing if key.startswith("P")]
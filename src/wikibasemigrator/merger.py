@@ -2,17 +2,32 @@
 Module to merge wikibase entities
 """
 
-import json
+import hashlib
 import logging
 
 from wikibaseintegrator.entities import ItemEntity
-from wikibaseintegrator.models import Claim, Claims, Qualifiers, Reference, Snak
+from wikibaseintegrator.models import Claim, Qualifiers, Reference, Snak
 from wikibaseintegrator.wbi_enums import ActionIfExists
 
 from wikibasemigrator import WbEntity
 
 logger = logging.getLogger(__name__)
 
+ENTITY_ID_VALUE_KEYS = frozenset({"entity-type", "numeric-id", "id"})
+
+
+def _canonicalize(value):
+    """
+    Convert the given json value into a hashable value that is independent of the key order of the contained dicts
+    :param value: json value
+    :return: hashable representation of the value
+    """
+    if isinstance(value, dict):
+        return dict, tuple(sorted((key, _canonicalize(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_canonicalize(item) for item in value)
+    return value
+
 
 class EntityMerger:
     """
@@ -25,6 +40,9 @@ class EntityMerger:
         """
 
         self.action_if_exists = action_if_exists
+        # datavalue hashes by object id → the datavalue is kept to ensure the id is not reused by another object
+        self._hash_cache: dict[int, tuple[dict, int]] = dict()
+        self._ref_hash_cache: dict[int, tuple[Reference, int]] = dict()
 
     def merge(self, source: WbEntity, target: WbEntity):
         """
@@ -93,20 +111,31 @@ class EntityMerger:
         :param target:
         :return:
         """
+        claim_index = {
+            property_number: self._index_claims_by_hash(claims)
+            for property_number, claims in target.claims.claims.items()
+        }
         for source_claim in source.claims:
-            self.merge_statement(source_claim, target)
+            self.merge_statement(source_claim, target, claim_index)
         for target_claim in target.claims:
             self._update_qualifier_order(target_claim)
 
-    def merge_statement(self, claim: Claim, target: WbEntity):
+    def merge_statement(
+        self, claim: Claim, target: WbEntity, claim_index: dict[str, dict[int, list[Claim]]] | None = None
+    ):
         """
         add the given claim to the target entity.
         If the statement already exists, the claim is merged into the existing statement
         :param claim: claim to add or merge
         :param target: entity the claim is added to
+        :param claim_index: target claims by property number and mainsnak hash. Updated if the claim is added
         :return:
         """
-        merge_with_claim = self._find_equivalent_mainsnak(claim, target.claims.get(claim.mainsnak.property_number))
+        property_number = claim.mainsnak.property_number
+        if claim_index is None:
+            claim_index = {property_number: self._index_claims_by_hash(target.claims.get(property_number))}
+        claims_by_hash = claim_index.setdefault(property_number, dict())
+        merge_with_claim = self._find_equivalent_mainsnak(claim, claims_by_hash)
         if merge_with_claim:
             self._merge_claim(claim, merge_with_claim)
         else:
@@ -114,6 +143,21 @@ class EntityMerger:
             #  → create test case and prepare fix
             # Issue: if snak value is unknown → KeyError
             target.claims.add(claim, action_if_exists=ActionIfExists.MERGE_REFS_OR_APPEND)
+            property_claims = target.claims.get(property_number)
+            if property_claims and property_claims[-1] is claim:
+                # claim was appended and not merged into an existing claim by wbi
+                claims_by_hash.setdefault(self._get_datavalue_hash(claim.mainsnak.datavalue), []).append(claim)
+
+    def _index_claims_by_hash(self, claims: list[Claim]) -> dict[int, list[Claim]]:
+        """
+        Index the given claims by the hash of their mainsnak datavalue
+        :param claims: claims to index
+        :return: claims by mainsnak hash
+        """
+        claims_by_hash: dict[int, list[Claim]] = dict()
+        for claim in claims:
+            claims_by_hash.setdefault(self._get_datavalue_hash(claim.mainsnak.datavalue), []).append(claim)
+        return claims_by_hash
 
     def _update_qualifier_order(self, claim: Claim):
         """
@@ -125,19 +169,17 @@ class EntityMerger:
         missing_qualifier_in_order = used_qualifier - set(claim.qualifiers_order)
         claim.qualifiers_order.extend(missing_qualifier_in_order)
 
-    def _find_equivalent_mainsnak(self, claim: Claim, claims: Claims) -> Claim | bool:
+    def _find_equivalent_mainsnak(self, claim: Claim, claims_by_hash: dict[int, list[Claim]]) -> Claim | bool:
         """
-        Find equivalent mainsnak from given list of claims
+        Find equivalent mainsnak from given claims indexed by their mainsnak hash
         Only checks if the mainsnak is equivalent as the qualifier are also merged
         :param claim:
-        :param claims:
+        :param claims_by_hash:
         :return:
         """
         source_hash = self._get_datavalue_hash(claim.mainsnak.datavalue)
-        for target_claim in claims:
-            has_compatible_qualifiers = self._qualifiers_merge_compatible(claim.qualifiers, target_claim.qualifiers)
-            statement_values_equal = self._get_datavalue_hash(target_claim.mainsnak.datavalue) == source_hash
-            if statement_values_equal and has_compatible_qualifiers:
+        for target_claim in claims_by_hash.get(source_hash, []):
+            if self._qualifiers_merge_compatible(claim.qualifiers, target_claim.qualifiers):
                 return target_claim
         return False
 
@@ -178,17 +220,6 @@ class EntityMerger:
         source_hash = self._get_datavalue_hash(snak.datavalue)
         return any(self._get_datavalue_hash(target_snak.datavalue) == source_hash for target_snak in snaks)
 
-    def _has_equivalent_reference(self, reference: Reference, references: list[Reference]) -> bool:
-        """
-        Check if an equivalent reference from given list of references exists
-        Only checks if the mainsnak is equivalent as the qualifier are also merged
-        :param reference:
-        :param references:
-        :return:
-        """
-        source_hash = self._get_reference_hash(reference)
-        return any(self._get_reference_hash(target_reference) == source_hash for target_reference in references)
-
     def _merge_claim(self, source: Claim, target: Claim):
         """
         Merge the claim qualifiers and references from source into target.
@@ -198,26 +229,62 @@ class EntityMerger:
         """
         if self._get_datavalue_hash(source.mainsnak.datavalue) != self._get_datavalue_hash(target.mainsnak.datavalue):
             logger.warning("Merging claims with different mainsnak hashes")
+        target_qualifier_hashes: dict[str, set[int]] = dict()
+        target_qualifier: Snak
+        for target_qualifier in target.qualifiers:
+            target_qualifier_hashes.setdefault(target_qualifier.property_number, set()).add(
+                self._get_datavalue_hash(target_qualifier.datavalue)
+            )
+        target_reference_hashes = {self._get_reference_hash(reference) for reference in target.references.references}
         qualifier: Snak
         for qualifier in source.qualifiers:
-            if self._has_equivalent_snak(qualifier, target.qualifiers.get(qualifier.property_number)):
-                # ToDo: can be removed once the action_if_exists is implemented
-                pass
-            else:
+            qualifier_hash = self._get_datavalue_hash(qualifier.datavalue)
+            qualifier_hashes = target_qualifier_hashes.setdefault(qualifier.property_number, set())
+            if qualifier_hash not in qualifier_hashes:
                 target.qualifiers.add(qualifier, action_if_exists=self.action_if_exists)
+                qualifier_hashes.add(qualifier_hash)
         for reference in source.references.references:
-            if self._has_equivalent_reference(reference, target.references.references):
-                # ToDo: can be removed once the action_if_exists is implemented
-                pass
-            else:
+            reference_hash = self._get_reference_hash(reference)
+            if reference_hash not in target_reference_hashes:
                 target.references.add(reference, action_if_exists=self.action_if_exists)
+                target_reference_hashes.add(reference_hash)
 
     def _get_datavalue_hash(self, datavalue: dict[str, str | int | float]) -> int:
-        return hash(json.dumps(datavalue, sort_keys=True))
+        """
+        Get the hash of the given datavalue. The hashes are cached for the lifetime of the merger
+        :param datavalue:
+        :return:
+        """
+        cached = self._hash_cache.get(id(datavalue))
+        if cached is not None and cached[0] is datavalue:
+            return cached[1]
+        value = datavalue.get("value")
+        if (
+            datavalue.get("type") == "wikibase-entityid"
+            and len(datavalue) == 2
+            and isinstance(value, dict)
+            and value.keys() == ENTITY_ID_VALUE_KEYS
+        ):
+            # fast path for the frequently recurring entity id values e.g. in references
+            datavalue_hash = hash(("wikibase-entityid", value["entity-type"], value["numeric-id"], value["id"]))
+        else:
+            datavalue_hash = hash(_canonicalize(datavalue))
+        self._hash_cache[id(datavalue)] = (datavalue, datavalue_hash)
+        return datavalue_hash
 
     def _get_reference_hash(self, reference: Reference) -> int:
-        reference_hash = 0
-        ref: Snak
-        for ref in reference:
-            reference_hash += self._get_datavalue_hash(ref.datavalue)
+        """
+        Get the order independent hash of the given reference, repeated snak values are taken into account.
+        The hashes are cached for the lifetime of the merger
+        :param reference:
+        :return:
+        """
+        cached = self._ref_hash_cache.get(id(reference))
+        if cached is not None and cached[0] is reference:
+            return cached[1]
+        digest = hashlib.blake2b(digest_size=8)
+        for snak_hash in sorted(self._get_datavalue_hash(ref.datavalue) for ref in reference):
+            digest.update(snak_hash.to_bytes(8, "little", signed=True))
+        reference_hash = int.from_bytes(digest.digest(), "little")
+        self._ref_hash_cache[id(reference)] = (reference, reference_hash)
         return reference_hash
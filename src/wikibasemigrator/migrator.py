@@ -1,22 +1,38 @@
+import gzip
 import json
 import logging
 import math
 import tempfile
-from collections.abc import Callable
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import threading
+import time
+from collections.abc import Callable, Collection, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
+from functools import cache, partial
 from pathlib import Path
 
-from wikibaseintegrator import WikibaseIntegrator, datatypes, wbi_login
+from requests import HTTPError
+from wikibaseintegrator import WikibaseIntegrator, datatypes, wbi_helpers, wbi_login
 from wikibaseintegrator.datatypes import BaseDataType
 from wikibaseintegrator.entities import ItemEntity, LexemeEntity, MediaInfoEntity, PropertyEntity
-from wikibaseintegrator.models import Alias, Aliases, Claim, LanguageValues, Qualifiers, Reference, References, Snak
+from wikibaseintegrator.models import (
+    Alias,
+    Aliases,
+    Claim,
+    LanguageValue,
+    LanguageValues,
+    Qualifiers,
+    Reference,
+    References,
+    Snak,
+)
 from wikibaseintegrator.wbi_config import config as wbi_config
 from wikibaseintegrator.wbi_enums import ActionIfExists, WikibaseSnakType
 from wikibaseintegrator.wbi_exceptions import MissingEntityException, MWApiError, NonExistentEntityError
 from wikibaseintegrator.wbi_helpers import mediawiki_api_call_helper
 
 from wikibasemigrator import WbEntity
+from wikibasemigrator.entity_cache import EntityCache
 from wikibasemigrator.exceptions import UnknownEntityTypeException, UserLoginRequiredException
 from wikibasemigrator.mapper import WikibaseItemMapper
 from wikibasemigrator.merger import EntityMerger
@@ -30,23 +46,103 @@ from wikibasemigrator.model.profile import (
 )
 from wikibasemigrator.model.translations import EntitySetTranslationResult, EntityTranslationResult
 from wikibasemigrator.util.RateLimiter import RateLimiter
-from wikibasemigrator.wikibase import Query, WikibaseBadges, WikibaseEntityTypes, get_default_user_agent
+from wikibasemigrator.wikibase import (
+    WBGETENTITIES_MAX_IDS,
+    WBGETENTITIES_MAX_IDS_BOT,
+    Query,
+    WikibaseBadges,
+    WikibaseEntityTypes,
+    ensure_connection_pool_size,
+    get_default_user_agent,
+)
 
 logger = logging.getLogger(__name__)
 
 wbi_config["USER_AGENT"] = "WikibaseMigrator/1.0 (https://www.wikidata.org/wiki/User:tholzheim)"
 
+DEFAULT_MAX_WORKERS = 10
+# number of entity migrations submitted per worker thread before waiting for completed ones
+MAX_IN_FLIGHT_PER_WORKER = 2
+# entity classes and the corresponding wbi entity apis by entity id prefix
+ENTITY_CLASSES_BY_PREFIX: dict[str, type[WbEntity]] = {
+    "Q": ItemEntity,
+    "P": PropertyEntity,
+    "L": LexemeEntity,
+    "M": MediaInfoEntity,
+}
+ENTITY_API_BY_PREFIX: dict[str, str] = {"Q": "item", "P": "property", "L": "lexeme", "M": "mediainfo"}
+# datatypes whose value can be migrated as is
+VALUE_DATATYPES: dict[str, type[BaseDataType]] = {
+    WbiDataTypes.STRING: datatypes.String,
+    WbiDataTypes.EXTERNAL_ID: datatypes.ExternalID,
+    WbiDataTypes.COMMONS_MEDIA: datatypes.CommonsMedia,
+    WbiDataTypes.ENTITY_SCHEMA: datatypes.EntitySchema,
+    WbiDataTypes.URL: datatypes.URL,
+    WbiDataTypes.PROPERTY: datatypes.Property,
+    # ToDo: links to a file in mediawiki commons → how to translate map to same file or also copy file
+    WbiDataTypes.GEO_SHAPE: datatypes.GeoShape,
+    WbiDataTypes.TABUlAR_DATA: datatypes.TabularData,
+}
+
+
+# serializes the appends of the worker threads to the debug log
+_migration_debug_log_lock = threading.Lock()
+
+
+@cache
+def get_migration_debug_log_path() -> Path:
+    """
+    Get the gzip compressed json lines file the migrated entities are dumped to for debugging.
+    The file is created once per run
+    :return: path of the file
+    """
+    path = Path(tempfile.gettempdir()).joinpath(f"WikibaseMigrator/migrations/{datetime.now():%Y%m%dT%H%M%S}.jsonl.gz")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
 
 class WikibaseMigrator:
     """
     migrates wikibase objects from one instance to another
     """
 
-    def __init__(self, profile: WikibaseMigrationProfile):
+    def __init__(self, profile: WikibaseMigrationProfile, max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        constructor
+        :param profile: migration profile
+        :param max_workers: default number of worker threads used to retrieve, translate and migrate entities
+        """
+        self.max_workers = max_workers
         self._source_wbi = None
         self._target_wbi = None
+        self._wbi_lock = threading.Lock()
         self.profile = profile
         self.mapper = WikibaseItemMapper(self.profile)
+        self._entity_caches: dict[str, EntityCache] = dict()
+        self._allowed_language_set: tuple[list[str], frozenset[str]] | None = None
+        self._allowed_sitelink_set: tuple[list[str], frozenset[str]] | None = None
+
+    def get_allowed_language_set(self) -> frozenset[str]:
+        """
+        Get the allowed languages of the profile as set for fast membership checks.
+        The set is rebuilt if the allowed languages of the profile are replaced
+        :return: allowed languages
+        """
+        allowed_languages = self.profile.get_allowed_languages()
+        if self._allowed_language_set is None or self._allowed_language_set[0] is not allowed_languages:
+            self._allowed_language_set = (allowed_languages, frozenset(allowed_languages))
+        return self._allowed_language_set[1]
+
+    def get_allowed_sitelink_set(self) -> frozenset[str]:
+        """
+        Get the allowed sitelinks of the profile as set for fast membership checks.
+        The set is rebuilt if the allowed sitelinks of the profile are replaced
+        :return: allowed sitelinks
+        """
+        allowed_sitelinks = self.profile.get_allowed_sitelinks()
+        if self._allowed_sitelink_set is None or self._allowed_sitelink_set[0] is not allowed_sitelinks:
+            self._allowed_sitelink_set = (allowed_sitelinks, frozenset(allowed_sitelinks))
+        return self._allowed_sitelink_set[1]
 
     @property
     def target_wbi(self) -> WikibaseIntegrator:
@@ -55,7 +151,9 @@ class WikibaseMigrator:
         :return:
         """
         if self._target_wbi is None:
-            self._target_wbi = self.get_wikibase_integrator(self.profile.target)
+            with self._wbi_lock:
+                if self._target_wbi is None:
+                    self._target_wbi = self.get_wikibase_integrator(self.profile.target, pool_maxsize=self.max_workers)
         return self._target_wbi
 
     @property
@@ -65,7 +163,9 @@ class WikibaseMigrator:
         :return:
         """
         if self._source_wbi is None:
-            self._source_wbi = self.get_wikibase_integrator(self.profile.source)
+            with self._wbi_lock:
+                if self._source_wbi is None:
+                    self._source_wbi = self.get_wikibase_integrator(self.profile.source, pool_maxsize=self.max_workers)
         return self._source_wbi
 
     def get_entities_from_source(self, entity_ids: list[str]) -> list[WbEntity]:
@@ -74,7 +174,7 @@ class WikibaseMigrator:
         :param entity_ids: ids of entity to retrieve
         :return:
         """
-        return self.get_entities(entity_ids, self.profile.source, self.source_wbi)
+        return self.get_entities(entity_ids, self.profile.source, self.source_wbi, use_cache=True)
 
     def get_entities_from_target(self, entity_ids: list[str]) -> list[WbEntity]:
         """
@@ -85,77 +185,231 @@ class WikibaseMigrator:
         return self.get_entities(entity_ids, self.profile.target, self.target_wbi)
 
     def get_entities(
-        self, entity_ids: list[str], wikibase_config: WikibaseConfig, wbi: WikibaseIntegrator, max_workers: int = 10
+        self,
+        entity_ids: list[str],
+        wikibase_config: WikibaseConfig,
+        wbi: WikibaseIntegrator,
+        max_workers: int | None = None,
+        chunk_size: int | None = None,
+        use_cache: bool = False,
     ) -> list[WbEntity]:
         """
         Get given list of entities as WikibaseIntegrator object from the given wikibase
         :param entity_ids: list of ids to fetch
         :param wikibase_config: config file of the wikibase to get the
         :param wbi:
-        :param max_workers:
+        :param max_workers: maximum number of worker threads. Defaults to the max_workers of the migrator
+        :param chunk_size: number of entities fetched per wbgetentities request.
+                           Defaults to the entity batch size of the wikibase
+        :param use_cache: If True the entity cache of the wikibase is used. Only use it for wikibases that are not
+                          edited by the migration e.g. the source wikibase
         :return:
         """
         result: list[WbEntity] = []
+        entity_batches = self.iter_entity_batches(entity_ids, wikibase_config, wbi, max_workers, chunk_size, use_cache)
+        for entity_batch in entity_batches:
+            result.extend(entity_batch)
+        logger.debug(f"Retrieved {len(result)} entity records")
+        return result
+
+    def iter_entity_batches(
+        self,
+        entity_ids: list[str],
+        wikibase_config: WikibaseConfig,
+        wbi: WikibaseIntegrator,
+        max_workers: int | None = None,
+        chunk_size: int | None = None,
+        use_cache: bool = False,
+    ) -> Iterator[list[WbEntity]]:
+        """
+        Get given list of entities from the given wikibase in batches.
+        Each batch is yielded as soon as it is retrieved so that it can be processed while the others are still fetched
+        :param entity_ids: list of ids to fetch
+        :param wikibase_config: config file of the wikibase to get the
+        :param wbi:
+        :param max_workers: maximum number of worker threads. Defaults to the max_workers of the migrator
+        :param chunk_size: number of entities fetched per wbgetentities request.
+                           Defaults to the entity batch size of the wikibase
+        :param use_cache: If True the entity cache of the wikibase is used. Cached records are only used if their
+                          revision is still the latest revision of the entity
+        :return: batches of entities
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        if chunk_size is None:
+            chunk_size = self.get_entity_batch_size(wikibase_config, wbi)
+        # duplicate ids would waste slots of the batch requests
+        entity_ids = sorted(set(entity_ids))
+        entity_cache = self.get_entity_cache(wikibase_config) if use_cache else None
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if entity_cache is not None:
+                cached_records = entity_cache.get_records(entity_ids)
+                # revalidate the cached records with a cheap revision query instead of fetching the whole records
+                latest_revisions: dict[str, int] = {}
+                for revisions in executor.map(
+                    partial(self.get_entity_revisions, wikibase_config=wikibase_config, wbi=wbi),
+                    Query.chunks(list(cached_records), chunk_size),
+                ):
+                    latest_revisions.update(revisions)
+                outdated_ids = [
+                    entity_id
+                    for entity_id, record in cached_records.items()
+                    if record.get("lastrevid") is None or record.get("lastrevid") != latest_revisions.get(entity_id)
+                ]
+                entity_cache.delete_records(outdated_ids)
+                for entity_id in outdated_ids:
+                    del cached_records[entity_id]
+                if cached_records:
+                    yield [self.get_entity_from_json(record, wbi) for record in cached_records.values()]
+                entity_ids = [entity_id for entity_id in entity_ids if entity_id not in cached_records]
             futures = []
-            for chunk in Query.chunks(entity_ids, 50):
+            for chunk in Query.chunks(entity_ids, chunk_size):
                 future = executor.submit(
-                    self.get_entity_batch, entity_ids=chunk, wbi=wbi, wikibase_config=wikibase_config
+                    self.get_entity_batch,
+                    entity_ids=chunk,
+                    wbi=wbi,
+                    wikibase_config=wikibase_config,
+                    entity_cache=entity_cache,
                 )
                 futures.append(future)
             for future in as_completed(futures):
-                entity_chunk = future.result()
-                result.extend(entity_chunk)
-        logger.debug(f"Retrieved {len(result)} entity records")
-        return result
+                yield future.result()
+
+    @staticmethod
+    def get_entity_batch_size(wikibase_config: WikibaseConfig, wbi: WikibaseIntegrator) -> int:
+        """
+        Get the number of entities to retrieve per wbgetentities request
+        :param wikibase_config: wikibase config
+        :param wbi:
+        :return: configured entity batch size or the maximum number of ids wbgetentities accepts
+        """
+        if wikibase_config.entity_batch_size is not None:
+            return wikibase_config.entity_batch_size
+        return WBGETENTITIES_MAX_IDS_BOT if wbi.is_bot else WBGETENTITIES_MAX_IDS
+
+    def get_entity_cache(self, wikibase_config: WikibaseConfig) -> EntityCache | None:
+        """
+        Get the entity cache of the given wikibase
+        :param wikibase_config: wikibase config
+        :return: entity cache or None if no cache ttl is configured for the wikibase
+        """
+        if wikibase_config.cache_ttl is None:
+            return None
+        cache_key = wikibase_config.mediawiki_api_url.unicode_string()
+        if cache_key not in self._entity_caches:
+            self._entity_caches[cache_key] = EntityCache(wikibase_config)
+        return self._entity_caches[cache_key]
 
     @staticmethod
+    def get_entity_revisions(
+        entity_ids: list[str],
+        wikibase_config: WikibaseConfig,
+        wbi: WikibaseIntegrator,
+    ) -> dict[str, int]:
+        """
+        Get the latest revision ids of the given entities
+        :param entity_ids: ids of the entities
+        :param wikibase_config: wikibase config
+        :param wbi:
+        :return: latest revision id by entity id. Missing entities are not included
+        """
+        params = {"action": "wbgetentities", "ids": "|".join(entity_ids), "props": "info", "format": "json"}
+        login = wbi.login
+        try:
+            lod = mediawiki_api_call_helper(
+                mediawiki_api_url=wikibase_config.mediawiki_api_url.unicode_string(),
+                data=params,
+                login=login,
+                allow_anonymous=login is None,
+                is_bot=wbi.is_bot,
+                **wikibase_config.mediawiki_api_config.get_parameters(),
+            )
+        except (MWApiError, HTTPError) as e:
+            logger.warning(f"Querying the revisions of {len(entity_ids)} entities failed: {e}")
+            return {}
+        return {
+            entity_id: record["lastrevid"]
+            for entity_id, record in lod.get("entities", {}).items()
+            if "lastrevid" in record
+        }
+
+    @classmethod
     def get_entity_batch(
-        entity_ids: list[str], wikibase_config: WikibaseConfig, wbi: WikibaseIntegrator, **kwargs
+        cls,
+        entity_ids: list[str],
+        wikibase_config: WikibaseConfig,
+        wbi: WikibaseIntegrator,
+        entity_cache: EntityCache | None = None,
+        **kwargs,
     ) -> list[WbEntity]:
         """
         Get entities in batches from the wikibase
         :param wikibase_config:
         :param wbi:
         :param entity_ids:
+        :param entity_cache: cache to store the retrieved entity records in
         :return:
         """
         entity_ids_param = "|".join(entity_ids)
-        params = {"action": "wbgetentities", "ids": entity_ids_param, "format": "json"}
+        # utf8 avoids the escaping of non-ASCII characters which shrinks the response and speeds up the json decoding
+        params = {"action": "wbgetentities", "ids": entity_ids_param, "format": "json", "utf8": 1}
 
         login = wbi.login
         allow_anonymous = login is None
         is_bot = wbi.is_bot
         start = datetime.now()
-        lod = mediawiki_api_call_helper(
-            mediawiki_api_url=wikibase_config.mediawiki_api_url.unicode_string(),
-            data=params,
-            login=login,
-            allow_anonymous=allow_anonymous,
-            is_bot=is_bot,
-            **wikibase_config.mediawiki_api_config.get_parameters(),
-            **kwargs,
-        )
+        try:
+            lod = mediawiki_api_call_helper(
+                mediawiki_api_url=wikibase_config.mediawiki_api_url.unicode_string(),
+                data=params,
+                login=login,
+                allow_anonymous=allow_anonymous,
+                is_bot=is_bot,
+                **wikibase_config.mediawiki_api_config.get_parameters(),
+                **kwargs,
+            )
+        except NonExistentEntityError:
+            raise
+        except (MWApiError, HTTPError) as e:
+            if len(entity_ids) <= 1:
+                raise
+            # e.g. the batch exceeds the number of ids the user is allowed to query → retry with halved batches
+            logger.warning(
+                f"Querying entity batch of {len(entity_ids)} entities failed, retrying with halved batches: {e}"
+            )
+            half = len(entity_ids) // 2
+            entities = cls.get_entity_batch(entity_ids[:half], wikibase_config, wbi, entity_cache, **kwargs)
+            entities.extend(cls.get_entity_batch(entity_ids[half:], wikibase_config, wbi, entity_cache, **kwargs))
+            return entities
         logger.debug(f"Querying entity batch of {len(entity_ids)} entities took {datetime.now() - start}")
         if lod.get("success", False):
+            records = lod.pop("entities", {})
+            if entity_cache is not None:
+                entity_cache.store_records(records)
             entities = []
-            for entity_id, record in lod.get("entities", {}).items():
-                if entity_id.startswith("Q"):
-                    entity = ItemEntity(api=wbi).from_json(record)
-                elif entity_id.startswith("P"):
-                    entity = PropertyEntity(api=wbi).from_json(record)
-                elif entity_id.startswith("L"):
-                    entity = LexemeEntity(api=wbi).from_json(record)
-                elif entity_id.startswith("M"):
-                    entity = MediaInfoEntity(api=wbi).from_json(record)
-                else:
-                    raise UnknownEntityTypeException(entity_id)
-                entities.append(entity)
+            while records:
+                # release the raw records while hydrating so that not the whole batch is kept twice in memory
+                _, record = records.popitem()
+                entities.append(cls.get_entity_from_json(record, wbi))
             return entities
         else:
             logger.error(f"Querying entity batches from Wikibase failed! {lod.get('warnings', '')}")
             return []
 
+    @staticmethod
+    def get_entity_from_json(record: dict, wbi: WikibaseIntegrator) -> WbEntity:
+        """
+        Get the entity object of the given wbgetentities record
+        :param record: entity record
+        :param wbi:
+        :return: entity
+        """
+        entity_id = record.get("id", "")
+        entity_class = ENTITY_CLASSES_BY_PREFIX.get(entity_id[:1])
+        if entity_class is None:
+            raise UnknownEntityTypeException(entity_id)
+        return entity_class(api=wbi).from_json(record)
+
     def get_item_from_source(self, qid: str) -> WbEntity | None:
         """
         Get item from source wikibase
@@ -173,22 +427,29 @@ class WikibaseMigrator:
         return self.get_entity(entity_id=qid, wikibase_config=self.profile.target, wbi=self.target_wbi)
 
     @staticmethod
-    def get_wikibase_integrator(wikibase_config: WikibaseConfig) -> WikibaseIntegrator:
+    def get_wikibase_integrator(
+        wikibase_config: WikibaseConfig, pool_maxsize: int = DEFAULT_MAX_WORKERS
+    ) -> WikibaseIntegrator:
         """
         Get the WikibaseIntegrator with proper login if defined
         :param wikibase_config:
+        :param pool_maxsize: number of connections kept open per host e.g. the number of worker threads
         :return:
         """
-        login = WikibaseMigrator.get_wikibase_login(wikibase_config)
+        login = WikibaseMigrator.get_wikibase_login(wikibase_config, pool_maxsize=pool_maxsize)
+        if login is None:
+            # anonymous requests of wbi use a shared module level session
+            ensure_connection_pool_size(wbi_helpers.default_session, pool_maxsize)
         return WikibaseIntegrator(login=login)
 
     @staticmethod
     def get_wikibase_login(
-        wikibase_config: WikibaseConfig,
+        wikibase_config: WikibaseConfig, pool_maxsize: int = DEFAULT_MAX_WORKERS
     ) -> wbi_login.Login | wbi_login.Clientlogin | wbi_login.OAuth1 | wbi_login.OAuth2 | None:
         """
         Get a login instance for the given wikibase configuration
         :param wikibase_config:
+        :param pool_maxsize: number of connections kept open per host e.g. the number of worker threads
         :return:
         """
         if wikibase_config.bot_password:
@@ -226,6 +487,8 @@ class WikibaseMigrator:
             )
         else:
             login = None
+        if login is not None:
+            ensure_connection_pool_size(login.get_session(), pool_maxsize)
         return login
 
     @classmethod
@@ -243,24 +506,12 @@ class WikibaseMigrator:
             start_time = datetime.now()
             user_agent = get_default_user_agent()
             mediawiki_api_config = wikibase_config.mediawiki_api_config.get_parameters()
-            if entity_id.startswith("Q"):
-                item = wbi.item.get(
-                    entity_id, mediawiki_api_url=mediawiki_api_url, user_agent=user_agent, **mediawiki_api_config
-                )
-            elif entity_id.startswith("P"):
-                item = wbi.property.get(
-                    entity_id, mediawiki_api_url=mediawiki_api_url, user_agent=user_agent, **mediawiki_api_config
-                )
-            elif entity_id.startswith("L"):
-                item = wbi.lexeme.get(
-                    entity_id, mediawiki_api_url=mediawiki_api_url, user_agent=user_agent, **mediawiki_api_config
-                )
-            elif entity_id.startswith("M"):
-                item = wbi.mediainfo.get(
-                    entity_id, mediawiki_api_url=mediawiki_api_url, user_agent=user_agent, **mediawiki_api_config
-                )
-            else:
+            entity_api_name = ENTITY_API_BY_PREFIX.get(entity_id[:1])
+            if entity_api_name is None:
                 raise UnknownEntityTypeException(entity_id)
+            item = getattr(wbi, entity_api_name).get(
+                entity_id, mediawiki_api_url=mediawiki_api_url, user_agent=user_agent, **mediawiki_api_config
+            )
             logger.debug(f"Entity {entity_id} retrival took {(datetime.now() - start_time).total_seconds()}s")
         except NonExistentEntityError as e:
             item = None
@@ -283,20 +534,43 @@ class WikibaseMigrator:
         :param entity: item to extract the ids from
         :return: List of used ids
         """
-        ids = set()
-        ids.add(entity.id)
+        return list(set(cls._iter_entity_ids(entity)))
+
+    @classmethod
+    def _iter_entity_ids(cls, entity: WbEntity) -> Iterator[str]:
+        """
+        Iterate over all entity ids used in the given entity in a single pass over the claims.
+        Ids might be yielded multiple times
+        :param entity: entity to extract the ids from
+        :return: used ids
+        """
+        yield entity.id
+        # bound locally as it is looked up for every snak of the entity
+        iter_snak_entity_ids = cls._iter_snak_entity_ids
         for claim in entity.claims:
-            ids.add(claim.mainsnak.property_number)
-            unit = cls.get_unit_id(claim.mainsnak)
+            yield from iter_snak_entity_ids(claim.mainsnak)
+            for qualifier in claim.qualifiers:
+                yield from iter_snak_entity_ids(qualifier)
+            for reference_block in claim.references:
+                for reference in reference_block.snaks:
+                    yield from iter_snak_entity_ids(reference)
+
+    @classmethod
+    def _iter_snak_entity_ids(cls, snak: Snak) -> Iterator[str]:
+        """
+        Iterate over the entity ids used in the given snak
+        :param snak: snak to extract the ids from
+        :return: property, unit and item value ids
+        """
+        yield snak.property_number
+        datatype = snak.datatype
+        if datatype == "wikibase-item":
+            if snak.snaktype is WikibaseSnakType.KNOWN_VALUE:
+                yield snak.datavalue["value"]["id"]
+        elif datatype == "quantity":
+            unit = cls.get_unit_id(snak)
             if unit is not None:
-                ids.add(unit)
-            if cls._is_item_and_known_value(claim.mainsnak):
-                ids.add(claim.mainsnak.datavalue["value"]["id"])
-            ids_used_in_qualifiers = cls.get_all_entity_ids_from_qualifiers(claim.qualifiers)
-            ids.update(ids_used_in_qualifiers)
-            ids_used_in_references = cls.get_all_entity_ids_from_references(claim.references)
-            ids.update(ids_used_in_references)
-        return list(ids)
+                yield unit
 
     @classmethod
     def get_all_entity_ids_from_qualifiers(cls, qualifiers: Qualifiers) -> list[str]:
@@ -305,15 +579,7 @@ class WikibaseMigrator:
         :param qualifiers:
         :return:
         """
-        ids = set()
-        for qualifier in qualifiers:
-            ids.add(qualifier.property_number)
-            unit = cls.get_unit_id(qualifier)
-            if unit is not None:
-                ids.add(unit)
-            if cls._is_item_and_known_value(qualifier):
-                ids.add(qualifier.datavalue["value"]["id"])
-        return list(ids)
+        return list({entity_id for qualifier in qualifiers for entity_id in cls._iter_snak_entity_ids(qualifier)})
 
     @classmethod
     def get_unit_id(cls, snak: Snak) -> str | None:
@@ -337,25 +603,14 @@ class WikibaseMigrator:
         :param references:
         :return:
         """
-        ids = set()
-        for reference_block in references:
-            for reference in reference_block.snaks:
-                ids.add(reference.property_number)
-                unit = cls.get_unit_id(reference)
-                if unit is not None:
-                    ids.add(unit)
-                if cls._is_item_and_known_value(reference):
-                    ids.add(reference.datavalue["value"]["id"])
-        return list(ids)
-
-    @classmethod
-    def _is_item_and_known_value(cls, snak: Snak) -> bool:
-        """
-        Checks if the snak is a wikibase-item and is a known value
-        :param snak: snak to check
-        :return: bool
-        """
-        return snak.datatype == "wikibase-item" and snak.snaktype is WikibaseSnakType.KNOWN_VALUE
+        return list(
+            {
+                entity_id
+                for reference_block in references
+                for reference in reference_block.snaks
+                for entity_id in cls._iter_snak_entity_ids(reference)
+            }
+        )
 
     def update_item(self, item: WbEntity) -> None:
         """
@@ -380,29 +635,49 @@ class WikibaseMigrator:
         """
         self.mapper.prepare_cache_for(item_ids)
 
-    def add_translation_result_mappings(self, translation_result: EntityTranslationResult):
+    def add_translation_result_mappings(
+        self, translation_result: EntityTranslationResult, used_ids: list[str] | None = None
+    ):
         """
         add translation mappings that are used by the item to the translation result
         :param translation_result:
+        :param used_ids: ids used by the original entity. If not given they are extracted from the entity
         :return:
         """
-        used_ids = self.get_all_entity_ids(translation_result.original_entity)
-        mappings = {source_id: self.mapper.get_mapping_for(source_id) for source_id in used_ids}
-        translation_result.add_entity_mappings(mappings)
+        if used_ids is None:
+            used_ids = self.get_all_entity_ids(translation_result.original_entity)
+        translation_result.add_entity_mappings(self.mapper.get_mappings_for(used_ids))
+
+    def translate_entity_by_id(self, entity_id: str) -> EntityTranslationResult | None:
+        """
+        Translate the entity corresponding to the given entity_id
+        :param entity_id: id of the entity to translate
+        :return: translation result or None if the entity does not exist in the source
+        """
+        entity = self.get_entity(entity_id=entity_id, wikibase_config=self.profile.source, wbi=self.source_wbi)
+        if entity is None:
+            return None
+        return self.translate_entity(entity)
 
     def translate_entities_by_id(
         self,
         item_ids: list[str],
         merge_existing_entities: bool = True,
         progress_callback: Callable[[str], None] | None = None,
+        entity_done_callback: Callable[[Future], None] | None = None,
+        max_workers: int | None = None,
     ) -> EntitySetTranslationResult:
         """
         Translate the items corresponding to the given item_ids
         :param progress_callback:
         :param item_ids: entity ids to translate
         :param merge_existing_entities If True existing entities are merged. Otherwise, existing entities are ignored
+        :param entity_done_callback: callback function to call for each translated entity e.g. for progress tracking
+        :param max_workers: maximum number of worker threads. Defaults to the max_workers of the migrator
         :return:
         """
+        if max_workers is None:
+            max_workers = self.max_workers
         if progress_callback is None:
 
             def progress_callback(x: str):
@@ -415,17 +690,36 @@ class WikibaseMigrator:
                 return None
 
         progress_callback(f"Fetching {len(item_ids)} items records from {self.profile.source.name}")
-        entities = self.get_entities_from_source(item_ids)
-        used_ids = set()
-        for item in entities:
-            used_ids.update(self.get_all_entity_ids(item))
-        progress_callback("Preparing entity ID translation mappings")
-        self.prepare_mapper_cache_by_ids(list(used_ids))
-        if not merge_existing_entities:
-            progress_callback("Excluding existing entities")
-            entities = [entity for entity in entities if self.mapper.get_mapping_for(entity.id) is None]
-        progress_callback("Translating entities")
-        translated_entities = [self.translate_entity(entity) for entity in entities]
+        entity_batches = self.iter_entity_batches(item_ids, self.profile.source, self.source_wbi, use_cache=True)
+        # resolve the lazily initialized state before the workers start → the workers only read shared state
+        self.target_wbi  # noqa: B018
+        allowed_languages = self.get_allowed_language_set()
+        allowed_sitelinks = self.get_allowed_sitelink_set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            # each batch is translated while the following batches are still fetched
+            for entities in entity_batches:
+                used_ids_by_entity = {entity.id: self.get_all_entity_ids(entity) for entity in entities}
+                used_ids = set().union(*used_ids_by_entity.values())
+                progress_callback(f"Preparing entity ID translation mappings for {len(entities)} entities")
+                # prepare the mappings of the batch at once → the translation of the entities does not query mappings
+                self.prepare_mapper_cache_by_ids(list(used_ids))
+                if not merge_existing_entities:
+                    existing_mappings = self.mapper.get_mappings_for(used_ids_by_entity)
+                    entities = [entity for entity in entities if existing_mappings[entity.id] is None]
+                progress_callback(f"Translating {len(entities)} entities")
+                for entity in entities:
+                    future = executor.submit(
+                        self.translate_entity,
+                        entity,
+                        allowed_languages=allowed_languages,
+                        allowed_sitelinks=allowed_sitelinks,
+                        used_ids=used_ids_by_entity[entity.id],
+                    )
+                    if entity_done_callback:
+                        future.add_done_callback(entity_done_callback)
+                    futures.append(future)
+            translated_entities = [future.result() for future in futures]
         translation_results = EntitySetTranslationResult.from_list(translated_entities)
         if merge_existing_entities:
             progress_callback("Augment existing entities")
@@ -444,11 +738,12 @@ class WikibaseMigrator:
             if self.mapper.get_mapping_for(entity.original_entity.id) is not None
         ]
 
-        source_existing_entity_ids = [entity.original_entity.id for entity in entities_to_merge]
+        source_existing_entity_ids = {entity.original_entity.id for entity in entities_to_merge}
+        existing_mappings = self.mapper.mappings
         merge_mapping = {
             source: target
-            for source, target in self.mapper.get_existing_mappings().items()
-            if source in source_existing_entity_ids
+            for source in source_existing_entity_ids
+            if (target := existing_mappings.get(source)) is not None
         }
         target_entities = self.get_entities_from_target(list(merge_mapping.values()))
         target_entities_by_id = {entity.id: entity for entity in target_entities}
@@ -475,9 +770,10 @@ class WikibaseMigrator:
     def translate_entity(
         self,
         entity: WbEntity,
-        allowed_languages: list[str] | None = None,
-        allowed_sitelinks: list[str] | None = None,
+        allowed_languages: Collection[str] | None = None,
+        allowed_sitelinks: Collection[str] | None = None,
         with_back_reference: bool = True,
+        used_ids: list[str] | None = None,
     ) -> EntityTranslationResult:
         """
         translates given entity from source to target wikibase instance
@@ -485,13 +781,21 @@ class WikibaseMigrator:
         :param allowed_sitelinks:
         :param allowed_languages:
         :param entity: wikibase item to translate from the source wikibase instance
+        :param used_ids: ids used by the entity for which the mapper cache is already prepared.
+        If not given the ids are extracted and the mapper cache is prepared for them
         :return:
         """
         if allowed_languages is None:
-            allowed_languages = self.profile.get_allowed_languages()
+            allowed_languages = self.get_allowed_language_set()
+        elif not isinstance(allowed_languages, (set, frozenset)):
+            allowed_languages = frozenset(allowed_languages)
         if allowed_sitelinks is None:
-            allowed_sitelinks = self.profile.get_allowed_sitelinks()
-        self.prepare_mapper_cache(entity)
+            allowed_sitelinks = self.get_allowed_sitelink_set()
+        elif not isinstance(allowed_sitelinks, (set, frozenset)):
+            allowed_sitelinks = frozenset(allowed_sitelinks)
+        if used_ids is None:
+            used_ids = self.get_all_entity_ids(entity)
+            self.prepare_mapper_cache_by_ids(used_ids)
         match entity.ETYPE:
             case WikibaseEntityTypes.ITEM:
                 new_entity = self.target_wbi.item.new()
@@ -510,7 +814,7 @@ class WikibaseMigrator:
         result = EntityTranslationResult(
             entity=new_entity, original_entity=entity, missing_properties=[], missing_items=[]
         )
-        self.add_translation_result_mappings(result)
+        self.add_translation_result_mappings(result, used_ids)
         # add label
         self.translate_labels(entity, new_entity, allowed_languages)
         self.translate_descriptions(entity, new_entity, allowed_languages)
@@ -536,18 +840,22 @@ class WikibaseMigrator:
                 else:
                     target.set(language=target_language, value=mul_value.value, action_if_exists=ActionIfExists.KEEP)
 
-    def translate_labels(self, source: WbEntity, target: WbEntity, allowed_languages: list[str]) -> None:
+    def translate_labels(self, source: WbEntity, target: WbEntity, allowed_languages: Collection[str]) -> None:
         """
         translate the labels from the source entity to the target entity
         :return:
         """
-        for label in source.labels:
-            if label.language not in allowed_languages:
-                continue
-            target.labels.set(label.language, label.value)
+        # the values are added in bulk as LanguageValues.set() repeats its argument checks for each language
+        target.labels.values.update(
+            {
+                label.language: LanguageValue(label.language, label.value)
+                for label in source.labels
+                if label.value and label.language in allowed_languages
+            }
+        )
         self._resolve_mul(source.labels, target.labels)
 
-    def translate_descriptions(self, source: WbEntity, target: WbEntity, allowed_languages: list[str]):
+    def translate_descriptions(self, source: WbEntity, target: WbEntity, allowed_languages: Collection[str]):
         """
         translate the descriptions from the source entity to the target entity
         :param source:
@@ -555,17 +863,19 @@ class WikibaseMigrator:
         :param allowed_languages:
         :return:
         """
+        new_descriptions = dict()
         for description in source.descriptions:
-            if description.language not in allowed_languages:
+            if not description.value or description.language not in allowed_languages:
                 continue
             desc_value = description.value
             if desc_value == source.labels.get(description.language):
                 # Workaround for label=description validation error → https://github.com/wikimedia/mediawiki-extensions-Wikibase/blob/ae95f990c447a6470667fd16d5b1513003e74cee/repo/i18n/en.json#L190C50-L190C121
                 # ToDo: Decide how to handle this
                 continue
-            target.descriptions.set(description.language, description.value)
+            new_descriptions[description.language] = LanguageValue(description.language, desc_value)
+        target.descriptions.values.update(new_descriptions)
 
-    def translate_aliases(self, source: WbEntity, target: WbEntity, allowed_languages: list[str]):
+    def translate_aliases(self, source: WbEntity, target: WbEntity, allowed_languages: Collection[str]):
         """
         translate the aliases from the source entity to the target entity
         :param source:
@@ -581,7 +891,7 @@ class WikibaseMigrator:
 
         self._resolve_mul(source.aliases, target.aliases)
 
-    def translate_sitelinks(self, source: WbEntity, target: WbEntity, allowed_sitelinks: list[str]):
+    def translate_sitelinks(self, source: WbEntity, target: WbEntity, allowed_sitelinks: Collection[str]):
         """
         translate the sitelinks from the source entity to the target entity
         :param source:
@@ -632,16 +942,13 @@ class WikibaseMigrator:
         :param result:
         :return:
         """
-        new_qualifiers = Qualifiers()
-        for qualifier in claim.qualifiers:
-            new_qualifier = self._translate_snak(qualifier, translation_result=result)
-            if new_qualifier is not None:
-                # ToDo: Add action_if_exists once implemented
-                new_qualifiers.add(new_qualifier)
-            else:
-                # ToDo: Handle missing property in target
-                pass
-        return new_qualifiers
+        translated_qualifiers = [
+            self._translate_snak(qualifier, translation_result=result) for qualifier in claim.qualifiers
+        ]
+        # ToDo: Handle missing property in target
+        # ToDo: Add action_if_exists once implemented
+        # the mainsnak is added directly to avoid the json round trip of Qualifiers.add() for claims
+        return Qualifiers().set([qualifier.mainsnak for qualifier in translated_qualifiers if qualifier is not None])
 
     def translate_references(self, claim: Claim, result: EntityTranslationResult) -> References:
         """
@@ -652,20 +959,15 @@ class WikibaseMigrator:
         """
         new_references = References()
         for reference in claim.references:
+            translated_snaks = [self._translate_snak(snak, translation_result=result) for snak in reference.snaks]
+            if not translated_snaks or any(new_snak is None for new_snak in translated_snaks):
+                # ToDo: Handle missing property in target
+                continue
             new_reference = Reference()
-            new_reference_completely_translated = True
-            for snak in reference.snaks:
-                new_snak = self._translate_snak(snak, translation_result=result)
-                if new_snak is not None:
-                    # ToDo: Add action_if_exists once implemented
-                    new_reference.add(new_snak)
-                else:
-                    # ToDo: Handle missing property in target
-                    new_reference_completely_translated = False
-                    pass
-            if len(new_reference.snaks) > 0 and new_reference_completely_translated:
-                # ToDo: Add action_if_exists once implemented
-                new_references.add(new_reference)
+            for new_snak in translated_snaks:
+                new_reference.snaks.add(new_snak.mainsnak)
+            # ToDo: Add action_if_exists once implemented
+            new_references.add(new_reference)
         return new_references
 
     def _translate_snak(
@@ -678,9 +980,10 @@ class WikibaseMigrator:
         :param kwargs: additional arguments to pass to the translated snak for example references and qualifiers
         :return: Translated snak
         """
-        if self.profile.mapping.ignore_unknown_values and snak.snaktype is WikibaseSnakType.UNKNOWN_VALUE:
+        mapping_config = self.profile.mapping
+        if mapping_config.ignore_unknown_values and snak.snaktype is WikibaseSnakType.UNKNOWN_VALUE:
             return None
-        if self.profile.mapping.ignore_no_values and snak.snaktype is WikibaseSnakType.NO_VALUE:
+        if mapping_config.ignore_no_values and snak.snaktype is WikibaseSnakType.NO_VALUE:
             return None
         new_property_number = self.mapper.get_mapping_for(snak.property_number)
         if new_property_number is None:
@@ -701,61 +1004,53 @@ class WikibaseMigrator:
                 return new_snak
             new_snak = self._translate_snak_with_type_mismatch(snak, translation_result=translation_result, **kwargs)
             return new_snak
+        value = snak.datavalue.get("value", {})
+        value_datatype = VALUE_DATATYPES.get(snak.datatype)
+        if value_datatype is not None:
+            return value_datatype(prop_nr=new_property_number, value=value, snaktype=snak.snaktype, **kwargs)
         match snak.datatype:
-            case WbiDataTypes.STRING:
-                new_snak = datatypes.String(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
-            case WbiDataTypes.EXTERNAL_ID:
-                new_snak = datatypes.ExternalID(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
             case WbiDataTypes.WIKIBASE_ITEM:
-                source_id = snak.datavalue.get("value", {}).get("id", None)
+                source_id = value.get("id", None)
                 mapped_id = self.mapper.get_mapping_for(source_id) if source_id else None
                 if mapped_id:
                     new_snak = datatypes.Item(
                         prop_nr=new_property_number, value=mapped_id, snaktype=snak.snaktype, **kwargs
                     )
                 else:
-                    translation_result.add_missing_item(snak.datavalue["value"]["id"])
+                    translation_result.add_missing_item(value["id"])
                     new_snak = None
             case WbiDataTypes.TIME:
                 new_snak = datatypes.Time(
                     prop_nr=new_property_number,
-                    time=snak.datavalue["value"]["time"],
-                    before=snak.datavalue["value"]["before"],
-                    after=snak.datavalue["value"]["after"],
-                    precision=snak.datavalue["value"]["precision"],
+                    time=value["time"],
+                    before=value["before"],
+                    after=value["after"],
+                    precision=value["precision"],
                     # calendar does not need to be mapped
-                    calendarmodel=snak.datavalue["value"]["calendarmodel"],
-                    timezone=snak.datavalue["value"]["timezone"],
+                    calendarmodel=value["calendarmodel"],
+                    timezone=value["timezone"],
                     snaktype=snak.snaktype,
                     **kwargs,
                 )
-            case WbiDataTypes.COMMONS_MEDIA:
-                new_snak = datatypes.CommonsMedia(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
             case WbiDataTypes.QUANTITY:
                 unit_id = self.get_unit_id(snak)
                 mapped_unit_id = self.mapper.get_mapping_for(unit_id) if unit_id else None
                 mapped_unit_url = f"{self.profile.target.item_prefix}{mapped_unit_id}" if mapped_unit_id else None
                 new_snak = datatypes.Quantity(
                     prop_nr=new_property_number,
-                    amount=snak.datavalue["value"]["amount"],
+                    amount=value["amount"],
                     unit=mapped_unit_url,
-                    upper_bound=snak.datavalue["value"].get("upper_bound", None),
-                    lower_bound=snak.datavalue["value"].get("lower_bound", None),
+                    upper_bound=value.get("upper_bound", None),
+                    lower_bound=value.get("lower_bound", None),
                     snaktype=snak.snaktype,
                     **kwargs,
                 )
             case WbiDataTypes.MONOLINGUALTEXT:
-                language = snak.datavalue.get("value", {}).get("language", None)
-                if language in self.profile.get_allowed_languages():
+                language = value.get("language", None)
+                if language in self.get_allowed_language_set():
                     new_snak = datatypes.MonolingualText(
                         prop_nr=new_property_number,
-                        text=snak.datavalue["value"].get("text", None),
+                        text=value.get("text", None),
                         language=language,
                         snaktype=snak.snaktype,
                         **kwargs,
@@ -763,42 +1058,21 @@ class WikibaseMigrator:
             case WbiDataTypes.GLOBE_COORDINATE:
                 new_snak = datatypes.GlobeCoordinate(
                     prop_nr=new_property_number,
-                    latitude=snak.datavalue["value"].get("latitude", None),
-                    longitude=snak.datavalue["value"].get("longitude", None),
-                    altitude=snak.datavalue["value"].get("altitude", None),
-                    precision=snak.datavalue["value"].get("precision", None),
+                    latitude=value.get("latitude", None),
+                    longitude=value.get("longitude", None),
+                    altitude=value.get("altitude", None),
+                    precision=value.get("precision", None),
                     snaktype=snak.snaktype,
                     # globe does not need to be mapped
-                    globe=snak.datavalue["value"].get("globe", None),
+                    globe=value.get("globe", None),
                     **kwargs,
                 )
-            case WbiDataTypes.ENTITY_SCHEMA:
-                new_snak = datatypes.EntitySchema(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
-            case WbiDataTypes.URL:
-                new_snak = datatypes.URL(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
-            case WbiDataTypes.PROPERTY:
-                new_snak = datatypes.Property(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
-            case WbiDataTypes.GEO_SHAPE:
-                # ToDo: links to a file in mediawiki commons → how to translate map to same file or also copy file
-                new_snak = datatypes.GeoShape(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
-            case WbiDataTypes.TABUlAR_DATA:
-                # ToDo: links to a file in mediawiki commons → how to translate map to same file or also copy file
-                new_snak = datatypes.TabularData(
-                    prop_nr=new_property_number, value=snak.datavalue["value"], snaktype=snak.snaktype, **kwargs
-                )
         return new_snak
 
     def add_back_reference(self, entity: ItemEntity, source_id: str) -> None:
         """
         Add back reference to the given entity. The kind of backreference is read from the profile config.
+        The back reference is added in place before the migration so that it is written in the same edit as the entity
         :param entity:
         :param source_id:
         :return:
@@ -835,17 +1109,47 @@ class WikibaseMigrator:
         summary: str | None,
         entity_done_callback: Callable[[Future], None] | None = None,
         migration_mark: MigrationMark | None = None,
-        max_workers: int = 10,
-    ) -> list[EntitySetTranslationResult]:
+        max_workers: int | None = None,
+    ) -> list[EntityTranslationResult]:
         """
         migrate given entities to the target wikibase instance
         :param translations:
         :param summary: summary of the changes
         :param entity_done_callback: callback function to call for each migrated entity e.g. for progress tracking
         :param migration_mark:
-        :param max_workers: maximum number of worker threads
+        :param max_workers: maximum number of worker threads. Defaults to the max_workers of the migrator
         :return: list of migrated entities containing the new ID in case of creation
         """
+        return list(
+            self.iter_migrate_entities_to_target(
+                translations,
+                summary=summary,
+                entity_done_callback=entity_done_callback,
+                migration_mark=migration_mark,
+                max_workers=max_workers,
+            )
+        )
+
+    def iter_migrate_entities_to_target(
+        self,
+        translations: EntitySetTranslationResult,
+        summary: str | None,
+        entity_done_callback: Callable[[Future], None] | None = None,
+        migration_mark: MigrationMark | None = None,
+        max_workers: int | None = None,
+    ) -> Iterator[EntityTranslationResult]:
+        """
+        migrate given entities to the target wikibase instance.
+        Each migrated entity is yielded as soon as its migration is done
+        :param translations:
+        :param summary: summary of the changes
+        :param entity_done_callback: callback function to call for each migrated entity e.g. for progress tracking
+        :param migration_mark:
+        :param max_workers: maximum number of worker threads. Defaults to the max_workers of the migrator
+        :return: migrated entities containing the new ID in case of creation
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
         logger.info(f"Migrating {len(translations.entities)} entities to target {self.profile.target.name}: {summary}")
         throttle = self.profile.throttle
         if throttle:
@@ -858,8 +1162,11 @@ class WikibaseMigrator:
             # Unlimited: full parallelism, no limiter
             num_workers = max_workers
             limiter = None
-        login = self.get_wikibase_login(self.profile.target)
-        results = []
+        # reuse the login and session of the target integrator to keep the connections alive across migrations
+        login = self.target_wbi.login
+        ensure_connection_pool_size(
+            login.get_session() if login is not None else wbi_helpers.default_session, num_workers
+        )
 
         def _throttled_migrate(entity, **kwargs):
             """Wrapper that acquires a rate-limit slot INSIDE the worker,
@@ -868,26 +1175,43 @@ class WikibaseMigrator:
                 limiter.acquire()
             return self._migrate_entity(entity=entity, **kwargs)
 
+        mediawiki_api_url = self.profile.target.mediawiki_api_url.unicode_string()
+        tags = self.profile.target.get_tags()
+        mediawiki_api_config = self.profile.target.mediawiki_api_config
+        # cached records of the edited entities are outdated e.g. if source and target are the same wikibase
+        target_cache = self.get_entity_cache(self.profile.target)
+
+        def _done(futures: Iterable[Future]) -> Iterator[EntityTranslationResult]:
+            """Report and yield the given completed migrations.
+            The callback runs in the consuming thread so that it does not contend with the migration workers"""
+            for future in futures:
+                if entity_done_callback:
+                    entity_done_callback(future)
+                result = future.result()
+                if target_cache is not None and result.created_entity is not None:
+                    target_cache.delete_records([result.created_entity.id])
+                yield result
+
+        # bound the submitted migrations so that the results are yielded while the remaining entities are submitted
+        max_in_flight = MAX_IN_FLIGHT_PER_WORKER * num_workers
         with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = []
+            pending: set[Future] = set()
             for entity in translations:
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from _done(done)
                 self.add_migration_mark_to_entity(entity, migration_mark)
                 future = executor.submit(
                     _throttled_migrate,
                     entity=entity,
                     summary=summary,
-                    mediawiki_api_url=self.profile.target.mediawiki_api_url.unicode_string(),
-                    tags=self.profile.target.get_tags(),
+                    mediawiki_api_url=mediawiki_api_url,
+                    tags=tags,
                     login=login,
-                    mediawiki_api_config=self.profile.target.mediawiki_api_config,
+                    mediawiki_api_config=mediawiki_api_config,
                 )
-                futures.append(future)
-                if entity_done_callback:
-                    future.add_done_callback(entity_done_callback)
-            for future in as_completed(futures):
-                result = future.result()
-                results.append(result)
-        return results
+                pending.add(future)
+            yield from _done(as_completed(pending))
 
     def add_migration_mark_to_entity(
         self, translation: EntityTranslationResult, migration_mark: MigrationMark | None = None
@@ -923,14 +1247,9 @@ class WikibaseMigrator:
         """
         if mediawiki_api_config is None:
             mediawiki_api_config = MediaWikiApiConfig()
+        if logger.isEnabledFor(logging.DEBUG):
+            WikibaseMigrator._dump_entity(entity)
         try:
-            if logger.level <= logging.DEBUG:
-                entity_json = entity.entity.get_json()
-                path = Path(tempfile.gettempdir()).joinpath(
-                    f"WikibaseMigrator/migrations/{datetime.now()}_{entity.original_entity.id}.json"
-                )
-                path.parent.mkdir(parents=True, exist_ok=True)
-                path.write_text(json.dumps(entity_json, indent=4))
             res = entity.entity.write(
                 mediawiki_api_url=mediawiki_api_url,
                 summary=summary,
@@ -940,16 +1259,49 @@ class WikibaseMigrator:
             )
             entity.created_entity = res
         except MWApiError as e:
-            logger.info(f"Failed to migrate entity {entity.original_entity.id} over {mediawiki_api_url}")
             error = f"Error: {str(e)}, details: {e.messages}"
             entity.errors.append(error)
-            logger.exception(e)
+            WikibaseMigrator._log_migration_error(entity, mediawiki_api_url, e)
         except Exception as e:
-            logger.info(f"Failed to migrate entity {entity.original_entity.id} over {mediawiki_api_url}")
             entity.errors.append(str(e))
-            logger.exception(e)
+            WikibaseMigrator._log_migration_error(entity, mediawiki_api_url, e)
         return entity
 
+    @staticmethod
+    def _log_migration_error(entity: EntityTranslationResult, mediawiki_api_url: str, error: Exception) -> None:
+        """
+        Log the failed migration of the given entity. The traceback is only formatted if debug logging is enabled
+        :param entity: entity that failed to migrate
+        :param mediawiki_api_url: api url of the target wikibase
+        :param error: raised error
+        """
+        # lazy arguments → the message is only formatted if it is emitted
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.exception("Failed to migrate entity %s over %s", entity.original_entity.id, mediawiki_api_url)
+        else:
+            logger.warning(
+                "Failed to migrate entity %s over %s: %s", entity.original_entity.id, mediawiki_api_url, error
+            )
+
+    @staticmethod
+    def _dump_entity(entity: EntityTranslationResult) -> None:
+        """
+        Append the json of the given entity to the debug log of the run
+        :param entity: entity to dump
+        """
+        try:
+            # compact dump as json only uses its C encoder without indentation
+            record = json.dumps(
+                {"id": entity.original_entity.id, "time": time.time(), "entity": entity.entity.get_json()},
+                ensure_ascii=False,
+            )
+            path = get_migration_debug_log_path()
+            # each append adds a gzip member → the file stays readable with gzip.open even if the run is aborted
+            with _migration_debug_log_lock, gzip.open(path, "at", encoding="utf-8") as f:
+                f.write(record + "\n")
+        except (OSError, TypeError, ValueError) as e:
+            logger.debug(f"Unable to dump entity {entity.original_entity.id}: {e}")
+
     def has_type_mismatch(self, source_pid, target_pid) -> bool:
         """
         Checks if source and target property have a type mismatch
@@ -58,6 +58,18 @@ class WikibaseConfig(BaseModel):
     user_token: UserToken | None = None
     tag: str | None = None
     mediawiki_api_config: MediaWikiApiConfig = MediaWikiApiConfig()
+    cache_ttl: int | None = Field(
+        default=None,
+        description="Time in seconds the entity records retrieved from the source wikibase are cached on disk between "
+        "runs. Cached records are only used if they are still the latest revision of the entity. "
+        "If not set the entities are always retrieved from the wikibase",
+    )
+    entity_batch_size: int | None = Field(
+        default=None,
+        gt=0,
+        description="Number of entities retrieved per wbgetentities request. "
+        "If not set 500 is used for bots and 50 otherwise",
+    )
 
     def __post_init__(self):
         if isinstance(self.user, str) and self.user.strip() == "":
@@ -125,10 +137,20 @@ class EntityMappingConfig(BaseModel):
     location_of_mapping: MigrationWikibaseLocation = MigrationWikibaseLocation.TARGET
     item_mapping_query: str
     property_mapping_query: str
+    combined_mapping_query: str | None = Field(
+        default=None,
+        description="Optional query resolving item and property mappings at once. "
+        "If set, it is used instead of the item and property mapping queries to reduce the number of requests",
+    )
     languages: list[str] | None = None
     sitelinks: list[str] | None = None
     ignore_no_values: bool = False
     ignore_unknown_values: bool = False
+    cache_ttl: int | None = Field(
+        default=None,
+        description="Time in seconds the item mappings are persisted on disk between runs. "
+        "If not set the mappings are only cached in memory",
+    )
 
 
 class EntityBackReferenceType(str, Enum):
@@ -1,26 +1,26 @@
 import logging
 from collections.abc import Generator
-
-from pydantic import BaseModel, ConfigDict, Field
+from dataclasses import dataclass, field
 
 from wikibasemigrator import WbEntity
 
 logger = logging.getLogger(__name__)
 
 
-class EntityTranslationResult(BaseModel):
+@dataclass(slots=True)
+class EntityTranslationResult:
     """
-    wikibase migration translation result of an entity
+    wikibase migration translation result of an entity.
+    A slotted dataclass as one result is kept in memory for each translated entity
     """
 
-    model_config = ConfigDict(arbitrary_types_allowed=True)
     entity: WbEntity
     original_entity: WbEntity
-    missing_properties: list[str] = Field(default_factory=list)
-    missing_items: list[str] = Field(default_factory=list)
-    entity_mapping: dict[str, str | None] = Field(default_factory=dict)
+    missing_properties: list[str] = field(default_factory=list)
+    missing_items: list[str] = field(default_factory=list)
+    entity_mapping: dict[str, str | None] = field(default_factory=dict)
     created_entity: WbEntity | None = None
-    errors: list[str] = Field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
 
     def add_missing_property(self, property_id: str):
         """
@@ -57,8 +57,9 @@ class EntityTranslationResult(BaseModel):
         self.entity_mapping.update(mappings)
 
 
-class EntitySetTranslationResult(BaseModel):
-    entities: dict[str, EntityTranslationResult] = Field(default_factory=dict)
+@dataclass(slots=True)
+class EntitySetTranslationResult:
+    entities: dict[str, EntityTranslationResult] = field(default_factory=dict)
 
     @classmethod
     def from_list(cls, entities: list[EntityTranslationResult]) -> "EntitySetTranslationResult":
@@ -118,14 +119,14 @@ class EntitySetTranslationResult(BaseModel):
         Get all missing item mappings
         :return:
         """
-        return [value for value in self.get_missing_mappings() if value.startswith("Q")]
+        return [key for key, value in self.get_mapping().items() if value is None and key.startswith("Q")]
 
     def get_missing_property_mapings(self) -> list[str]:
         """
         Get all missing property mappings
         :return:
         """
-        return [value for value in self.get_missing_mappings() if value.startswith("P")]
+        return [key for key, value in self.get_mapping().items() if value is None and key.startswith("P")]
 
     def get_translation_source_item_ids(self):
         """
@@ -150,13 +151,14 @@ class EntitySetTranslationResult(BaseModel):
         """
         Get IDs of all source entities that are used
         """
-        return [entity_id for entity_id in self.get_mapping()]
+        return list(self.get_mapping())
 
     def get_target_entity_ids(self) -> list[str]:
         """
-        Get IDs of all target entities that are used
+        Get IDs of all target entities that are used. Each ID is only returned once
+        even if multiple source entities are mapped to it
         """
-        return [entity_id for entity_id in self.get_mapping().values() if entity_id is not None]
+        return list(dict.fromkeys(entity_id for entity_id in self.get_mapping().values() if entity_id is not None))
 
     def get_source_root_entity_ids(self):
         """
@@ -171,10 +173,8 @@ class EntitySetTranslationResult(BaseModel):
         :param source_id:
         :return:
         """
-        for item in self.entities.values():
-            if item.original_entity.id == source_id:
-                return item
-        return None
+        # the results are keyed by the id of their source entity
+        return self.entities.get(source_id)
 
     def __iter__(self) -> Generator[EntityTranslationResult, None, None]:
         yield from self.entities.values()
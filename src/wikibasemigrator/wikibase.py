@@ -1,17 +1,20 @@
+import csv
 import hashlib
+import io
 import json
 import logging
 import tempfile
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from enum import Enum
-from functools import partial
+from functools import cache, partial
 from pathlib import Path
 from string import Template
 
 import requests
 from pydantic import HttpUrl
-from SPARQLWrapper import JSON, POST, SPARQLWrapper
+from requests.adapters import HTTPAdapter
+from SPARQLWrapper import CSV, JSON, POST, SPARQLWrapper
 from wikibaseintegrator import __version__
 
 from wikibasemigrator.model.datatypes import WikidataDataTypes
@@ -20,8 +23,24 @@ logger = logging.getLogger(__name__)
 
 
 WIKIBASE_PREFIX = "http://wikiba.se/ontology#"
-
-
+# maximum number of entity ids wbgetentities accepts per request for non-bot users
+WBGETENTITIES_MAX_IDS = 50
+# maximum number of entity ids wbgetentities accepts per request for users with the apihighlimits right e.g. bots
+WBGETENTITIES_MAX_IDS_BOT = 500
+PROPERTY_DATATYPE_QUERY = Template("""
+PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+PREFIX wikibase: <http://wikiba.se/ontology#>
+SELECT * WHERE {
+  VALUES ?p {
+    $property_ids
+  }
+  ?p rdf:type wikibase:Property;
+    wikibase:propertyType ?type.
+}
+""")
+
+
+@cache
 def get_default_user_agent() -> str:
     """
     Get default user agent
@@ -29,6 +48,32 @@ def get_default_user_agent() -> str:
     return f"WikibaseMigrator/{__version__}"
 
 
+def ensure_connection_pool_size(session: requests.Session, pool_maxsize: int) -> None:
+    """
+    Ensure that the connection pools of the given session keep at least the given number of connections.
+    The requests default of 10 connections per host discards connections if more threads use the session
+    :param session: http session
+    :param pool_maxsize: number of connections to keep per host
+    """
+    adapter = session.get_adapter("https://")
+    if isinstance(adapter, HTTPAdapter) and getattr(adapter, "_pool_maxsize", 0) >= pool_maxsize:
+        return
+    adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+@cache
+def get_session() -> requests.Session:
+    """
+    Get the shared http session.
+    Reusing the session keeps the connections to the wikibase APIs alive across requests and threads
+    """
+    session = requests.Session()
+    session.headers.update({"User-Agent": get_default_user_agent()})
+    return session
+
+
 class Query:
     """
     Holds basic functions to query a wikibase
@@ -84,23 +129,12 @@ class Query:
         :param item_prefix: namespace of the wikibase entities
         :return: mapping from the property ids to the datatype
         """
-        query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX wikibase: <http://wikiba.se/ontology#>
-        SELECT * WHERE {
-          VALUES ?p {
-            $property_ids
-          }
-          ?p rdf:type wikibase:Property;
-            wikibase:propertyType ?type.
-        }
-        """
         if not property_ids:
             return {}
         property_uris = map(partial(cls.add_namespace, namespace=item_prefix.unicode_string()), property_ids)
         values = list(map(cls.get_sparql_uri, property_uris))
         lod = cls.execute_values_query_in_chunks(
-            query_template=Template(query),
+            query_template=PROPERTY_DATATYPE_QUERY,
             param_name="property_ids",
             values=values,
             endpoint_url=endpoint_url,
@@ -120,7 +154,13 @@ class Query:
 
     @classmethod
     def execute_values_query_in_chunks(
-        cls, query_template: Template, param_name: str, values: list[str], endpoint_url: HttpUrl, chunk_size: int = 1000
+        cls,
+        query_template: Template,
+        param_name: str,
+        values: list[str],
+        endpoint_url: HttpUrl,
+        chunk_size: int = 1000,
+        result_format: str = JSON,
     ):
         """
         Execute given query in chunks to speedup execution
@@ -129,6 +169,7 @@ class Query:
         :param query_template:
         :param param_name:
         :param values:
+        :param result_format: format of the query results. See execute_query
         :return:
         """
         lod = []
@@ -142,6 +183,7 @@ class Query:
                     cls.execute_query,
                     query=query,
                     endpoint_url=endpoint_url,
+                    result_format=result_format,
                 )
                 futures.append(future)
             for future in as_completed(futures):
@@ -150,22 +192,31 @@ class Query:
         return lod
 
     @classmethod
-    def execute_query(cls, query: str, endpoint_url: HttpUrl) -> list[dict]:
+    def execute_query(cls, query: str, endpoint_url: HttpUrl, result_format: str = JSON) -> list[dict]:
         """
         Execute given query against given endpoint
         :param query:
         :param endpoint_url:
+        :param result_format: format of the query results either JSON or CSV.
+        CSV results are smaller but only contain the plain values of the bindings
         :return:
         """
         query_first_line = query.split("\n")[0][:30] if query.strip().startswith("#") else ""
         query_hash = hashlib.sha512(query.encode("utf-8")).hexdigest()
         logger.debug(f"Executing SPARQL query {query_first_line} ({query_hash}) against {endpoint_url}")
         start = datetime.now()
-        sparql = SPARQLWrapper(endpoint_url.unicode_string(), agent=get_default_user_agent(), returnFormat=JSON)
+        sparql = SPARQLWrapper(
+            endpoint_url.unicode_string(), agent=get_default_user_agent(), returnFormat=result_format
+        )
         sparql.setQuery(query)
         sparql.setMethod(POST)
-        resp = sparql.query().convert()
-        lod_raw = resp.get("results", {}).get("bindings")
+        if result_format == CSV:
+            # only rely on the Accept header as the format parameter values differ between the endpoints
+            sparql.setOnlyConneg(True)
+            lod_raw = cls._parse_csv_results(sparql.query().convert())
+        else:
+            resp = sparql.query().convert()
+            lod_raw = resp.get("results", {}).get("bindings")
         logger.debug(
             f"Query ({query_hash}) execution finished! execution time : {(datetime.now() - start).total_seconds()}s, No. results: {len(lod_raw)}"  # noqa: E501
         )  # noqa: E501
@@ -173,6 +224,8 @@ class Query:
             file_name = f"{start}_{query_hash}"
             cls.save_query(name=file_name, query=query)
             cls.save_results(name=file_name, lod=lod_raw)
+        if result_format == CSV:
+            return [d for d in lod_raw if d]
         lod = []
         for d_raw in lod_raw:
             d = {key: record.get("value", None) for key, record in d_raw.items()}
@@ -180,6 +233,19 @@ class Query:
                 lod.append(d)
         return lod
 
+    @classmethod
+    def _parse_csv_results(cls, results: bytes | str) -> list[dict]:
+        """
+        Parse SPARQL CSV results
+        :param results: SPARQL CSV results
+        :return: list of records. Unbound values are omitted
+        """
+        if isinstance(results, bytes):
+            results = results.decode("utf-8")
+        reader = csv.reader(io.StringIO(results, newline=""))
+        header = next(reader, [])
+        return [{key: value for key, value in zip(header, row, strict=False) if value} for row in reader]
+
     @classmethod
     def check_availability_of_sparql_endpoint(cls, endpoint_url: HttpUrl):
         """
@@ -285,8 +351,7 @@ class MediaWikiEndpoint:
         res = {}
         try:
             logger.debug(f"Querying supported languages from {mediawiki_api_url}")
-            headers = {"User-Agent": get_default_user_agent()}
-            response = requests.get(mediawiki_api_url, params=params, headers=headers)
+            response = get_session().get(mediawiki_api_url.unicode_string(), params=params)
             data = response.json()
         except Exception as e:
             logger.error(e)
@@ -298,6 +363,52 @@ class MediaWikiEndpoint:
                 res[code] = label
         return res
 
+    @classmethod
+    def batch_get_labels(
+        cls,
+        mediawiki_api_url: HttpUrl,
+        entity_ids: list[str],
+        languages: tuple[str, ...] = ("en",),
+        chunk_size: int = WBGETENTITIES_MAX_IDS,
+    ) -> dict[str, str]:
+        """
+        Get the labels for the given entities with batched wbgetentities requests
+        :param mediawiki_api_url: api endpoint of the wiki
+        :param entity_ids: ids of the entities to get the labels for
+        :param languages: languages to query. If an entity has labels in multiple languages the first is used
+        :param chunk_size: number of entities per request
+        :return: mapping from the entity id to the label
+        """
+        labels: dict[str, str] = {}
+        if not entity_ids:
+            return labels
+        session = get_session()
+        for chunk in Query.chunks(list(entity_ids), chunk_size):
+            params = {
+                "action": "wbgetentities",
+                "props": "labels",
+                "languages": "|".join(languages),
+                "ids": "|".join(chunk),
+                "format": "json",
+                "utf8": 1,
+            }
+            try:
+                logger.debug(f"Querying labels of {len(chunk)} entities from {mediawiki_api_url}")
+                response = session.get(mediawiki_api_url.unicode_string(), params=params)
+                response.raise_for_status()
+                data = response.json()
+            except Exception as e:
+                logger.error(e)
+                continue
+            for entity_id, record in data.get("entities", {}).items():
+                entity_labels = record.get("labels", {})
+                for language in languages:
+                    label = entity_labels.get(language, {}).get("value")
+                    if isinstance(label, str):
+                        labels[entity_id] = label
+                        break
+        return labels
+
     @classmethod
     def check_availability(cls, mediawiki_api_url: HttpUrl):
         """
@@ -307,8 +418,7 @@ class MediaWikiEndpoint:
         """
         query = "action=query&titles=Main_Page&prop=revisions&rvprop=content&format=json"
         try:
-            headers = {"User-Agent": get_default_user_agent()}
-            response = requests.get(f"{mediawiki_api_url.unicode_string()}?{query}", headers=headers)
+            response = get_session().get(f"{mediawiki_api_url.unicode_string()}?{query}")
             response.raise_for_status()
         except Exception:
             return False
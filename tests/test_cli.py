@@ -2,7 +2,7 @@ from pathlib import Path
 
 from typer.testing import CliRunner
 
-from wikibasemigrator.cli import app
+from wikibasemigrator.cli import app, entity_id_sort_key
 
 runner = CliRunner()
 
@@ -41,3 +41,11 @@ def test_app_migration_without_authentication():
     assert result.exit_code == 0
     assert "Q80 (Tim Berners-Lee)" in result.output
     assert "Something went wrong migrating entity Q80" in result.output
+
+
+def test_entity_id_sort_key():
+    """
+    test that entity ids are sorted numerically within their type
+    """
+    entity_ids = ["Q10", "P31", "Q2", "P5", "Q1"]
+    assert sorted(entity_ids, key=entity_id_sort_key) == ["P5", "P31", "Q1", "Q2", "Q10"]
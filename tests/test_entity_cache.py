@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from wikibasemigrator.entity_cache import EntityCache
+from wikibasemigrator.model.profile import load_profile
+
+
+class TestEntityCache(unittest.TestCase):
+    """
+    Test EntityCache
+    """
+
+    def setUp(self):
+        profile_path = Path(__file__).parent.joinpath("../src/wikibasemigrator/profiles/FactGrid.yaml")
+        self.wikibase_config = load_profile(profile_path).source.model_copy(update={"cache_ttl": 60})
+
+    def test_store_records(self):
+        """
+        test storing and loading entity records
+        """
+        records = {
+            "Q80": {"id": "Q80", "lastrevid": 1, "labels": {"en": {"language": "en", "value": "Tim Berners-Lee"}}},
+            "Q1": {"id": "Q1", "missing": ""},
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            entity_cache = EntityCache(self.wikibase_config, cache_dir=Path(tmp_dir))
+            entity_cache.store_records(records)
+            cached_records = EntityCache(self.wikibase_config, cache_dir=Path(tmp_dir)).get_records(["Q80", "Q1", "Q2"])
+            self.assertEqual({"Q80": records["Q80"]}, cached_records)
+            expired_config = self.wikibase_config.model_copy(update={"cache_ttl": -1})
+            expired_records = EntityCache(expired_config, cache_dir=Path(tmp_dir)).get_records(["Q80"])
+            self.assertEqual({}, expired_records)
+
+    def test_delete_records(self):
+        """
+        test deleting entity records e.g. after the entities were edited
+        """
+        records = {
+            "Q80": {"id": "Q80", "lastrevid": 1},
+            "Q42": {"id": "Q42", "lastrevid": 2},
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            entity_cache = EntityCache(self.wikibase_config, cache_dir=Path(tmp_dir))
+            entity_cache.store_records(records)
+            entity_cache.delete_records(["Q80", "Q1"])
+            self.assertEqual({"Q42": records["Q42"]}, entity_cache.get_records(["Q80", "Q42"]))
@@ -1,6 +1,9 @@
+import tempfile
 import unittest
 from pathlib import Path
+from unittest import mock
 
+from wikibasemigrator import config
 from wikibasemigrator.mapper import WikibaseItemMapper
 from wikibasemigrator.model.datatypes import WbiDataTypes
 from wikibasemigrator.model.profile import load_profile
@@ -32,3 +35,64 @@ class TestWikibaseItemMapper(unittest.TestCase):
         self.assertIn("P2", mapper.target_property_types)
         self.assertEqual(WbiDataTypes.WIKIBASE_ITEM, mapper.source_property_types.get("P31"))
         self.assertEqual(WbiDataTypes.WIKIBASE_ITEM, mapper.target_property_types.get("P2"))
+
+    def test_persisting_mappings(self):
+        """
+        test persisting the item mappings between mapper instances
+        """
+        profile = self.profile.model_copy(deep=True)
+        profile.mapping.cache_ttl = 60
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = Path(tmp_dir)
+            mapper = WikibaseItemMapper(profile, cache_dir=cache_dir)
+            mapper._update_raw_cache(
+                [
+                    {config.MAPPING_QUERY_SOURCE_VARIABLE: "Q183", config.MAPPING_QUERY_TARGET_VARIABLE: "Q140530"},
+                    {config.MAPPING_QUERY_SOURCE_VARIABLE: "P31", config.MAPPING_QUERY_TARGET_VARIABLE: "P2"},
+                ]
+            )
+            mapper.update_cache()
+            cached_mapper = WikibaseItemMapper(profile, cache_dir=cache_dir)
+            self.assertTrue(cached_mapper.is_cached("Q183"))
+            self.assertEqual("Q140530", cached_mapper.mappings.get("Q183"))
+            self.assertFalse(cached_mapper.is_cached("P31"))
+            profile.mapping.cache_ttl = -1
+            expired_mapper = WikibaseItemMapper(profile, cache_dir=cache_dir)
+            self.assertFalse(expired_mapper.is_cached("Q183"))
+
+    def test_missing_mappings(self):
+        """
+        test tracking of the ids without mapping
+        """
+        mapper = WikibaseItemMapper(self.profile)
+        mapper._init_cache_for(["Q183", "Q80", "P31", "P580"])
+        mapper._update_raw_cache(
+            [
+                {config.MAPPING_QUERY_SOURCE_VARIABLE: "Q183", config.MAPPING_QUERY_TARGET_VARIABLE: "Q140530"},
+                {config.MAPPING_QUERY_SOURCE_VARIABLE: "P31", config.MAPPING_QUERY_TARGET_VARIABLE: "P2"},
+            ]
+        )
+        mapper.update_cache()
+        self.assertEqual(["Q80", "P580"], mapper.get_missing_mappings())
+        self.assertEqual(["Q80"], mapper.get_missing_item_mapings())
+        self.assertEqual(["P580"], mapper.get_missing_property_mapings())
+        self.assertEqual({"Q183": "Q140530", "P31": "P2"}, mapper.get_existing_mappings())
+        self.assertEqual({"Q183": "Q140530", "Q80": None}, mapper.get_mappings_for(["Q183", "Q80"]))
+        self.assertEqual((2, 0), (mapper.cache_hits, mapper.cache_misses))
+
+    def test_mappings_are_published_after_query(self):
+        """
+        test that ids are only considered as cached once their mapping query finished
+        """
+        mapper = WikibaseItemMapper(self.profile)
+        cached_during_query = []
+
+        def query_mappings(id_type: str, ids: list[str], query_raw: str) -> list[dict]:
+            cached_during_query.extend(mapper.is_cached(id_value) for id_value in ids)
+            return [{config.MAPPING_QUERY_SOURCE_VARIABLE: "Q183", config.MAPPING_QUERY_TARGET_VARIABLE: "Q140530"}]
+
+        with mock.patch.object(mapper, "_query_mappings", side_effect=query_mappings):
+            mapper.query_mappings_for(["Q183", "Q80"])
+        self.assertEqual([False, False], cached_during_query)
+        self.assertEqual({"Q183": "Q140530", "Q80": None}, mapper.get_mappings_for(["Q183", "Q80"]))
+        self.assertEqual(["Q80"], mapper.get_missing_mappings())
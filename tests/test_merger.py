@@ -5,6 +5,7 @@ from unittest import TestCase
 from deepdiff import DeepDiff
 from wikibaseintegrator import WikibaseIntegrator
 from wikibaseintegrator.entities import ItemEntity
+from wikibaseintegrator.models import Reference, Snak
 
 from wikibasemigrator.merger import EntityMerger
 
@@ -50,3 +51,48 @@ class TestEntityMerger(TestCase):
             len(source_entity.claims.get(prop_number)[0].references),
             len(merged_entity.claims.get(prop_number)[0].references),
         )
+
+    def test_get_reference_hash(self):
+        """
+        test that the reference hash is independent of the snak order
+        """
+        snaks = [
+            Snak(property_number="P1", datavalue={"value": "a", "type": "string"}),
+            Snak(property_number="P2", datavalue={"value": "b", "type": "string"}),
+        ]
+        reference = Reference()
+        reversed_reference = Reference()
+        for snak in snaks:
+            reference.add(snak)
+        for snak in reversed(snaks):
+            reversed_reference.add(snak)
+        merger = EntityMerger()
+        self.assertEqual(merger._get_reference_hash(reference), merger._get_reference_hash(reversed_reference))
+        other_reference = Reference()
+        other_reference.add(snaks[0])
+        self.assertNotEqual(merger._get_reference_hash(reference), merger._get_reference_hash(other_reference))
+
+    def test_get_datavalue_hash(self):
+        """
+        test that equal datavalues have the same hash independent of the key order
+        """
+        merger = EntityMerger()
+        entity_id_value = {"value": {"entity-type": "item", "numeric-id": 5, "id": "Q5"}, "type": "wikibase-entityid"}
+        reordered_entity_id_value = {
+            "type": "wikibase-entityid",
+            "value": {"id": "Q5", "numeric-id": 5, "entity-type": "item"},
+        }
+        other_entity_id_value = {
+            "value": {"entity-type": "item", "numeric-id": 6, "id": "Q6"},
+            "type": "wikibase-entityid",
+        }
+        time_value = {"value": {"time": "+2024-01-01T00:00:00Z", "precision": 11}, "type": "time"}
+        reordered_time_value = {"type": "time", "value": {"precision": 11, "time": "+2024-01-01T00:00:00Z"}}
+        self.assertEqual(
+            merger._get_datavalue_hash(entity_id_value), merger._get_datavalue_hash(reordered_entity_id_value)
+        )
+        self.assertNotEqual(
+            merger._get_datavalue_hash(entity_id_value), merger._get_datavalue_hash(other_entity_id_value)
+        )
+        self.assertEqual(merger._get_datavalue_hash(time_value), merger._get_datavalue_hash(reordered_time_value))
+        self.assertNotEqual(merger._get_datavalue_hash(entity_id_value), merger._get_datavalue_hash(time_value))
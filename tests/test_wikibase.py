@@ -54,6 +54,18 @@ class TestWikibaseEntityTypes(unittest.TestCase):
         for i, chunk in enumerate(Query.chunks([i for i in range(1, 10)], 3)):
             self.assertEqual(chunk, expected[i])
 
+    def test_parse_csv_results(self):
+        """
+        test parsing SPARQL CSV results
+        """
+        results = b'source_entity,target_entity\r\nQ183,Q140530\r\nQ80,\r\n"Q1,2",Q3\r\n'
+        expected = [
+            {"source_entity": "Q183", "target_entity": "Q140530"},
+            {"source_entity": "Q80"},
+            {"source_entity": "Q1,2", "target_entity": "Q3"},
+        ]
+        self.assertEqual(expected, Query._parse_csv_results(results))
+
     def test_check_availability_of_sparql_endpoint(self):
         """
         Test check_availability_of_sparql_endpoint
@@ -90,3 +102,12 @@ class TestMediaWikiEndpoint(unittest.TestCase):
         """
         url = HttpUrl("https://database.factgrid.de/w/api.php")
         self.assertTrue(MediaWikiEndpoint.check_availability(url))
+
+    def test_batch_get_labels(self):
+        """
+        Test batch_get_labels
+        """
+        url = HttpUrl("https://www.wikidata.org/w/api.php")
+        labels = MediaWikiEndpoint.batch_get_labels(url, ["Q80", "P31"])
+        self.assertEqual(labels.get("Q80"), "Tim Berners-Lee")
+        self.assertEqual(labels.get("P31"), "instance of")